@@ -0,0 +1,191 @@
+"""
+Headless benchmarks for the simulation kernels
+
+Usage:
+    python benchmarks.py forces --sizes 1000 4000 16000
+    python benchmarks.py integrators --span 2000
+    python benchmarks.py morton --sizes 50000 200000
+    python benchmarks.py precision --sizes 2000 8000 --steps 200
+    python benchmarks.py ring --steps 2000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from forces import DirectSummation, ParticleMesh
+from integrators import EulerIntegrator, WisdomHolman, AutoIntegrator
+from simulation import Simulation, precision_drift
+from spatial import SpatialGrid, morton_codes
+
+def timed(fn, *args, repeat=3):
+    """
+    Best of `repeat` wall times (after one warm up call) and the last result
+    """
+    result = fn(*args)
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def uniform_cloud(n, size=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, size, (n, 2)), rng.uniform(1, 10, n)
+
+def bench_forces(args):
+    """
+    Particle-mesh (and P3M) against direct summation: time and relative force error
+    """
+    print(f"{'bodies':>8} {'backend':>8} {'ms':>10} {'speedup':>8} {'median err':>11} {'p90 err':>9}")
+    for n in args.sizes:
+        pos, mass = uniform_cloud(n)
+        t_direct, exact = timed(DirectSummation().accelerations, pos, mass, repeat=1)
+        norm = np.linalg.norm(exact, axis=1)
+        print(f"{n:>8} {'direct':>8} {t_direct*1000:>10.1f} {1:>8.1f} {0:>11.4f} {0:>9.4f}")
+
+        for name, backend in (('pm', ParticleMesh(args.grid)), ('p3m', ParticleMesh(args.grid, p3m=True))):
+            t, acc = timed(backend.accelerations, pos, mass)
+            err = np.linalg.norm(acc - exact, axis=1)/norm
+            print(f"{n:>8} {name:>8} {t*1000:>10.1f} {t_direct/t:>8.1f} {np.median(err):>11.4f} {np.percentile(err, 90):>9.4f}")
+
+def planetary_system(integrator, dt):
+    """
+    Star with three planets on circular orbits, the kind of scene drawn by hand in DrawState
+    """
+    sim = Simulation(dt=dt, cull_every=0, forces=DirectSummation(), integrator=integrator)
+    star_mass = 40000
+    sim.add_body((0, 0), (0, 0), star_mass, 200)
+    for r, m in ((600, 40), (1000, 30), (1500, 20)):
+        sim.add_body((r, 0), (0, np.sqrt(star_mass/r)), m, 10)
+    return sim
+
+def bench_integrators(args):
+    """
+    Energy error and cost of covering the same simulated time span with each integrator
+    """
+    print(f"{'integrator':>10} {'dt':>6} {'steps':>7} {'ms':>9} {'energy err':>11}")
+    for integrator, dt in ((EulerIntegrator(), 0.1), (WisdomHolman(), 0.1), (WisdomHolman(), 1.0), (WisdomHolman(), 10.0)):
+        sim = planetary_system(integrator, dt)
+        e0 = sim.energy()
+        steps = int(args.span/dt)
+        started = time.perf_counter()
+        sim.step(steps)
+        elapsed = time.perf_counter() - started
+        print(f"{integrator.name:>10} {dt:>6} {steps:>7} {elapsed*1000:>9.1f} {abs((sim.energy() - e0)/e0):>11.3e}")
+
+def bench_morton(args):
+    """
+    Kernels that touch neighbours in memory, on bodies in insertion (random) order vs
+    after a Morton reorder, plus the cost of the reorder itself
+    """
+    print(f"{'bodies':>8} {'order':>8} {'pm ms':>8} {'pairs ms':>9} {'gather ms':>10}")
+    for n in args.sizes:
+        pos, mass = uniform_cloud(n)
+
+        sim = Simulation(capacity=n, cull_every=0, reorder_every=0)
+        for p, m in zip(pos, mass):
+            sim.add_body(p, (0, 0), m, 1)
+        t_reorder, _ = timed(sim.reorder, repeat=1)
+
+        order = np.argsort(morton_codes(pos), kind='stable')
+        for name, (p, m) in (('random', (pos, mass)), ('morton', (pos[order], mass[order]))):
+            t_pm, _ = timed(ParticleMesh(args.grid).accelerations, p, m)
+
+            grid = SpatialGrid(args.reach)
+            grid.update(np.arange(n), p, np.zeros(n))
+            t_pairs, pairs = timed(grid.pairs_within, args.reach)
+            t_gather, _ = timed(lambda: p[pairs[:, 0]] - p[pairs[:, 1]])
+            print(f"{n:>8} {name:>8} {t_pm*1000:>8.1f} {t_pairs*1000:>9.1f} {t_gather*1000:>10.1f}")
+        print(f"{n:>8} reorder took {t_reorder*1000:.1f} ms")
+
+def bench_precision(args):
+    """
+    float32 against float64 storage: time per step and how far the float32 run drifts
+    """
+    print(f"{'bodies':>8} {'f64 ms':>8} {'f32 ms':>8} {'max drift':>10} {'med drift':>10} {'f64 dE':>10} {'f32 dE':>10}")
+    for n in args.sizes:
+        pos, mass = uniform_cloud(n)
+        sim = Simulation(capacity=n, cull_every=0, reorder_every=0, forces=DirectSummation(), integrator=EulerIntegrator())
+        for p, m in zip(pos, mass):
+            sim.add_body(p, (0, 0), m, 1)
+        r = precision_drift(sim, args.steps)
+        print(f"{n:>8} {r['seconds_float64']/args.steps*1000:>8.2f} {r['seconds_float32']/args.steps*1000:>8.2f} "
+              f"{r['max_drift']:>10.3e} {r['median_drift']:>10.3e} {r['energy_error_float64']:>10.3e} {r['energy_error_float32']:>10.3e}")
+
+    sim = planetary_system(WisdomHolman(), 1.0)
+    r = precision_drift(sim, args.steps)
+    print(f"{'star+3':>8} {r['seconds_float64']/args.steps*1000:>8.2f} {r['seconds_float32']/args.steps*1000:>8.2f} "
+          f"{r['max_drift']:>10.3e} {r['median_drift']:>10.3e} {r['energy_error_float64']:>10.3e} {r['energy_error_float32']:>10.3e}")
+
+def ringed_planet(integrator, dt, count=64, distance=40):
+    """
+    Star with one planet carrying a ring of tracers on circular orbits around the planet
+    """
+    sim = Simulation(dt=dt, cull_every=0, forces=DirectSummation(), integrator=integrator)
+    star_mass, planet_mass, r = 40000, 400, 1000
+    sim.add_body((0, 0), (0, 0), star_mass, 200)
+    planet_vel = np.array((0, np.sqrt(star_mass/r)))
+    sim.add_body((r, 0), planet_vel, planet_mass, 10)
+
+    theta = np.linspace(0, 2*np.pi, count, endpoint=False)
+    dirs = np.stack((np.cos(theta), np.sin(theta)), axis=1)
+    speed = np.sqrt(planet_mass/distance)
+    sim.add_tracers((r, 0) + dirs*distance, planet_vel + np.stack((-dirs[:, 1], dirs[:, 0]), axis=1)*speed)
+    return sim
+
+def bench_ring(args):
+    """
+    Regression check: a planet's ring has to stay around the planet under Wisdom-Holman (and
+    'auto', which picks it for this scene); exits non-zero when a ring strays further than --tolerance (relative to its radius)
+    """
+    distance = 40
+    print(f"{'integrator':>10} {'dt':>6} {'steps':>7} {'min dist':>9} {'max dist':>9}")
+    failed = False
+    for integrator, dt in ((WisdomHolman(), 0.1), (AutoIntegrator(), 0.1)):
+        sim = ringed_planet(integrator, dt, distance=distance)
+        lo, hi = distance, distance
+        for _ in range(args.steps):
+            sim.step()
+            d = np.linalg.norm(sim.tracer_pos - sim.pos[1], axis=1)
+            lo, hi = min(lo, d.min()), max(hi, d.max())
+        failed |= max(distance - lo, hi - distance) > args.tolerance*distance
+        print(f"{integrator.name:>10} {dt:>6} {args.steps:>7} {lo:>9.2f} {hi:>9.2f}")
+    if failed:
+        raise SystemExit("ring left its planet")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulation benchmarks")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('forces', help="particle-mesh vs direct summation")
+    p.add_argument('--sizes', type=int, nargs='+', default=[1000, 4000, 16000])
+    p.add_argument('--grid', type=int, default=128)
+    p.set_defaults(fn=bench_forces)
+
+    p = sub.add_parser('integrators', help="Euler vs Wisdom-Holman on a planetary system")
+    p.add_argument('--span', type=float, default=2000, help="simulated time to cover")
+    p.set_defaults(fn=bench_integrators)
+
+    p = sub.add_parser('morton', help="memory locality of Morton ordered bodies")
+    p.add_argument('--sizes', type=int, nargs='+', default=[50000, 200000])
+    p.add_argument('--grid', type=int, default=512)
+    p.add_argument('--reach', type=float, default=8.0, help="neighbour pair distance")
+    p.set_defaults(fn=bench_morton)
+
+    p = sub.add_parser('precision', help="float32 vs float64 speed and drift")
+    p.add_argument('--sizes', type=int, nargs='+', default=[2000, 8000])
+    p.add_argument('--steps', type=int, default=200)
+    p.set_defaults(fn=bench_precision)
+
+    p = sub.add_parser('ring', help="tracers ringing the only planet of a star (regression check)")
+    p.add_argument('--steps', type=int, default=2000)
+    p.add_argument('--tolerance', type=float, default=0.1, help="allowed change of the ring radius, relative")
+    p.set_defaults(fn=bench_ring)
+
+    args = parser.parse_args(argv)
+    args.fn(args)
+
+if __name__ == '__main__':
+    main()
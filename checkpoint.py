@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+###
+### Snapshot files
+### - A snapshot is a flat dict of NumPy arrays and numbers (Simulation.snapshot() plus
+###   whatever the scene adds), stored as an uncompressed .npz
+###
+
+def write_snapshot(path, snap : dict, durable=False):
+    """
+    Write a snapshot to path, creating its directory
+    - Written to a temporary file next to path then renamed over it, so path always holds
+      a whole snapshot, the previous one if writing fails midway
+    - durable fsyncs the file before and the directory after the rename, so the snapshot
+      also survives a crash or power loss
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **snap)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if durable:
+        _fsync_directory(directory)
+
+def _fsync_directory(directory):
+    # Makes the rename itself durable, directories can not be opened on Windows
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def read_snapshot(path) -> dict:
+    """
+    Read a snapshot written by write_snapshot, numbers come back as Python scalars
+    """
+    with np.load(path) as data:
+        return {k: data[k].item() if data[k].ndim == 0 else data[k] for k in data.files}
+
+class CheckpointWriter(threading.Thread):
+    """
+    Writes snapshots durably on a background thread
+    - submit() only hands over the snapshot dict (already copied arrays), the caller never
+      waits on serializing or the disk
+    - A snapshot submitted while another is being written waits in a one slot queue per path,
+      replacing any older one, only the latest state of a file matters
+    """
+    def __init__(self):
+        super().__init__(name="checkpoint-writer", daemon=True)
+        self.written = 0
+        self.last_seconds = 0.0
+
+        self.__cond = threading.Condition()
+        self.__pending = {}
+        self.__busy = False
+        self.__stop = False
+
+    def submit(self, path, snap : dict):
+        with self.__cond:
+            self.__pending[path] = snap
+            self.__cond.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Wait for every submitted snapshot to be on disk, False on timeout
+        """
+        with self.__cond:
+            return self.__cond.wait_for(lambda: not self.__pending and not self.__busy, timeout)
+
+    def stop(self, timeout=5.0):
+        """
+        Finish the pending writes, then end the thread
+        """
+        with self.__cond:
+            self.__stop = True
+            self.__cond.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: self.__stop or self.__pending)
+                if not self.__pending:
+                    return
+                path = next(iter(self.__pending))
+                snap = self.__pending.pop(path)
+                self.__busy = True
+
+            t0 = time.perf_counter()
+            try:
+                write_snapshot(path, snap, durable=True)
+                self.written += 1
+            except OSError as e:
+                print(f"Checkpoint to {path} failed: {e}")
+            self.last_seconds = time.perf_counter() - t0
+
+            with self.__cond:
+                self.__busy = False
+                self.__cond.notify_all()
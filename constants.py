@@ -4,10 +4,26 @@ SCREEN_WIDTH = 1920
 SCREEN_HEIGHT = 1080
 FPS_CAP = 144
 BACKGROUND_COLOR = (50, 50, 50)
+FONT_NAME = "Arial"
+FONT_SIZE = 16
+
+#STARTUP SETTINGS
+CACHE_DIR = "~/.cache/gravitational-simulator" #resolved font paths and saved scenes
+FONT_CACHE_FILE = "fonts.json"
+SCENE_SAVE_FILE = "scene.npz" #F5 saves the scene here, main.py --scene loads it
+
+#AUTOSAVE SETTINGS
+AUTOSAVE_FILE = "autosave.npz" #periodic checkpoint, resumed from on startup
+CLEARED_SAVE_FILE = "cleared.npz" #the scene as it was before the last kill_all_objects (space)
+AUTOSAVE_SECONDS = 60 #time between checkpoints, 0 = no autosave
+AUTOSAVE_RESUME = True #start from the last checkpoint unless main.py --fresh
 
 #SIMULATOR PARAMETERS
 PLANET_DEFAULT_DENSITY = 0.005
 PLANET_MAX_DISTANCE = 3000 #distance an object can get away from the center of the screen
+WORLD_CENTER = (SCREEN_WIDTH/2, SCREEN_HEIGHT/2) #center of the screen in world coordinates (camera at origin)
+CULL_EVERY_STEPS = 60 #steps between retiring bodies beyond PLANET_MAX_DISTANCE, 0 = never
+REORDER_EVERY_STEPS = 120 #steps between sorting bodies into Morton order for memory locality, 0 = never
 
 DELTA_T = 0.1 #simulation time between frames
 
@@ -37,4 +53,64 @@ ZOOM_MIN = -95
 ZOOM_MAX = 500
 
 TYPE_VEL = "vel"
-TYPE_ACCEL = "accel"
\ No newline at end of file
+TYPE_ACCEL = "accel"
+
+#HUD SETTINGS
+HUD_REFRESH_MS = 250 #how often live HUD stats are polled
+HUD_MARGIN = 5
+HUD_SPACING = 2
+
+#PHYSICS SETTINGS
+SIM_ASYNC = False #step physics on a background worker thread instead of in the frame loop
+SIM_RATE_HZ = 144 #physics steps per second on the worker, 0 = as fast as possible
+SIM_DTYPE = "float64" #"float32" halves memory traffic for big scenes, reductions stay float64
+DIRECT_BLOCK_SIZE = 512 #rows per block in the direct summation kernel
+SPATIAL_CELL_SIZE = 64 #smallest spatial index cell, grows to fit the largest body
+FORCE_BACKEND = "direct" #"direct" pair sums, "pm" particle-mesh or "p3m" particle-mesh with short range pairs
+PM_GRID_SIZE = 128 #particle-mesh cells per side
+PM_SPLIT_CELLS = 1.0 #p3m long/short range split width, in mesh cells
+PM_CUTOFF_CELLS = 5.0 #p3m short range pair cutoff, in mesh cells
+INTEGRATOR = "auto" #"euler", "wh" (Wisdom-Holman) or "auto" (wh while one body dominates the mass)
+WH_MASS_RATIO = 0.9 #share of the total mass one body needs for "auto" to pick Wisdom-Holman
+PERIODIC_BOX = 0 #side of a periodic world [0, box)^2 that bodies wrap around, 0 = open world
+
+#TIME WARP SETTINGS
+WARP_STEPS = 10000 #steps jumped ahead per time warp
+WARP_BATCH = 100 #steps run back to back between checks for a cancel
+WARP_FRAME_MS = 50 #physics time per loop iteration while warping (frame loop physics only)
+WARP_HUD_MS = 250 #how often the progress line is redrawn while warping
+
+#PREDICTION SETTINGS
+PREDICT_STEPS = 2000 #steps ahead the placement preview integrates
+PREDICT_BATCH = 50 #steps per published chunk of the preview
+PREDICT_COLOR = (120, 120, 120)
+
+#TRAIL SETTINGS
+TRAIL_LENGTH = 240 #samples kept per body
+TRAIL_INTERVAL = 2 #simulation steps between samples
+TRAIL_MAX_BODIES = 1024 #bodies with a trail, the buffer is allocated once for this many
+TRAIL_FADE = 4 #brightness bands from tail to head, 1 = no fade
+TRAIL_LINE_POINTS = 20000 #most samples drawn as lines, more are drawn as pixels
+TRAIL_COLOR = (120, 140, 200)
+
+#TRACER SETTINGS
+TRACER_COLOR = (220, 220, 220)
+TRACER_RING_COUNT = 2000 #tracers spawned per ring
+TRACER_RING_INNER = 1.5 #ring inner edge, in radii of the body it circles
+TRACER_RING_OUTER = 4.0 #ring outer edge, in radii of the body it circles
+
+#NETWORK SETTINGS
+NET_HOST = "127.0.0.1"
+NET_PORT = 7777
+NET_SEND_HZ = 60 #frames per second the server offers each viewer, a slow viewer gets fewer
+NET_POS_QUANTUM = 0.01 #world units per step of a sent position
+NET_MOVE_THRESHOLD = 0.5 #world units a body must move before it is sent again
+NET_HIGH_WATER = 262144 #bytes queued to a viewer before its frames are dropped
+
+#EXPORT SETTINGS
+EXPORT_DIR = "frames" #where export.py writes its PNG sequence
+EXPORT_FPS = 60 #frame rate of an exported video, and the frame time fed to the scene
+EXPORT_EVERY_STEPS = 2 #simulation steps between exported frames
+EXPORT_WORKERS = 4 #PNG encoder threads
+EXPORT_QUEUE = 8 #rendered frames waiting for an encoder before rendering waits
+EXPORT_PNG_LEVEL = 3 #zlib level of exported PNGs, higher is smaller and slower
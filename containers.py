@@ -18,4 +18,67 @@ class CelestialSpriteGroup(pygame.sprite.Group):
         super().add(*celestials)            
 
     def draw(self, surface):
-        super().draw(surface)
\ No newline at end of file
+        super().draw(surface)
+
+class TransientGroup():
+    """
+    Insertion ordered set of TransientDrawEntity objects
+    - Add and remove are O(1) (dict backed) instead of list.remove()
+    - Transients with a `parent` (e.g. a VelocityArrow on a body) are indexed by it so they
+      can be killed along with the parent
+    """
+    def __init__(self):
+        self.__items = {}
+        self.__children = {}
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __iter__(self):
+        # Iterate a snapshot so transients can be removed while iterating
+        return iter(list(self.__items))
+
+    def __contains__(self, t):
+        return t in self.__items
+
+    def add(self, *transients):
+        for t in transients:
+            self.__items[t] = None
+            parent = getattr(t, "parent", None)
+            if parent is not None:
+                self.__children.setdefault(parent, {})[t] = None
+
+    # Drop-in for the list this replaces
+    append = add
+
+    def remove(self, *transients):
+        for t in transients:
+            if t not in self.__items:
+                continue
+            del self.__items[t]
+            parent = getattr(t, "parent", None)
+            siblings = self.__children.get(parent)
+            if siblings is not None:
+                siblings.pop(t, None)
+                if not siblings:
+                    del self.__children[parent]
+
+    def kill_children(self, parent):
+        """
+        Mark every transient linked to parent dead and remove them
+        """
+        for t in self.__children.pop(parent, {}):
+            t.dead = True
+            self.__items.pop(t, None)
+
+    def reap(self):
+        """
+        Remove transients that have been marked dead
+        """
+        self.remove(*[t for t in self.__items if t.dead])
+
+    def clear(self):
+        for t in self.__items:
+            t.dead = True
+        self.__items.clear()
+        self.__children.clear()
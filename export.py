@@ -0,0 +1,245 @@
+"""
+Render a scene offscreen into an image sequence or a video
+
+Usage:
+    python export.py --scene scene.npz --frames 600 --out frames/
+    python export.py --frames 3600 --every 4 --video run.mp4    (ffmpeg on PATH)
+
+Frames are drawn at a fixed simulation cadence (every N steps) into a pygame.Surface with
+pygame's display in dummy (offscreen) mode, then handed through a bounded queue to the
+encoders: a pool of PNG writer threads, or an ffmpeg process fed raw RGB frames. Rendering
+and encoding overlap, so the export runs at the pace of the slower of the two.
+"""
+import argparse
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import time
+import zlib
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy') # before pygame opens a window
+
+import numpy as np
+
+from constants import SCREEN_WIDTH, SCREEN_HEIGHT, AUTOSAVE_FILE, EXPORT_DIR, EXPORT_FPS, EXPORT_EVERY_STEPS, EXPORT_WORKERS, EXPORT_QUEUE, EXPORT_PNG_LEVEL
+
+def write_png(path, rgb : np.ndarray, level=EXPORT_PNG_LEVEL):
+    """
+    Write an (height, width, 3) uint8 array as an 8 bit RGB PNG
+    - Unfiltered rows and one zlib stream, zlib releases the GIL while compressing
+    """
+    height, width, _ = rgb.shape
+    rows = np.zeros((height, width*3 + 1), dtype=np.uint8) # leading 0 per row: no filter
+    rows[:, 1:] = rgb.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), level)))
+        f.write(chunk(b'IEND', b''))
+
+class PngSequence():
+    """
+    Pool of threads writing frames to directory as frame_000000.png, frame_000001.png, ...
+    - put() waits while queue_size frames are already waiting, rendering never gets further
+      ahead of the encoders than that
+    - If a frame fails to write, put() and close() raise the first error rather than wait
+      on encoders that may all have stopped
+    """
+    def __init__(self, directory, size, workers=EXPORT_WORKERS, queue_size=EXPORT_QUEUE, level=EXPORT_PNG_LEVEL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.size = size
+        self.level = level
+        self.waited = 0.0 # seconds put() spent waiting on a full queue
+        self.error = None
+
+        self.__queue = queue.Queue(queue_size)
+        self.__workers = [threading.Thread(target=self.__encode, name=f"png-encoder-{i}", daemon=True) for i in range(workers)]
+        for w in self.__workers:
+            w.start()
+
+    def put(self, index, frame : bytes):
+        t0 = time.perf_counter()
+        self.__enqueue((index, frame))
+        self.waited += time.perf_counter() - t0
+
+    def close(self):
+        for _ in self.__workers:
+            self.__enqueue(None)
+        for w in self.__workers:
+            w.join()
+        self.__check()
+
+    def __enqueue(self, item):
+        # Wait for room in short slices, so encoders that died are noticed
+        while True:
+            self.__check()
+            try:
+                self.__queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __check(self):
+        if self.error is not None:
+            raise RuntimeError(f"PNG encoder failed writing {self.directory}: {self.error}")
+
+    def __encode(self):
+        width, height = self.size
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            index, frame = item
+            try:
+                rgb = np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3)
+                write_png(os.path.join(self.directory, f"frame_{index:06d}.png"), rgb, self.level)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+                return
+
+class FfmpegVideo():
+    """
+    Raw RGB frames piped to an ffmpeg process, which encodes on its own threads
+    - A feeder thread writes the pipe from a bounded queue, so a pipe that is full because
+      ffmpeg is behind only stalls rendering once queue_size frames are waiting
+    - If ffmpeg exits early the feeder stops, and put() and close() raise its error rather
+      than wait on a queue nobody empties
+    """
+    def __init__(self, path, size, fps=EXPORT_FPS, queue_size=EXPORT_QUEUE, ffmpeg='ffmpeg'):
+        width, height = size
+        self.path = path
+        self.waited = 0.0
+        self.error = None
+
+        self.__process = subprocess.Popen(
+            [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps),
+             '-i', '-', '-pix_fmt', 'yuv420p', path],
+            stdin=subprocess.PIPE)
+        self.__queue = queue.Queue(queue_size)
+        self.__feeder = threading.Thread(target=self.__feed, name="ffmpeg-feeder", daemon=True)
+        self.__feeder.start()
+
+    def put(self, index, frame : bytes):
+        t0 = time.perf_counter()
+        self.__enqueue(frame)
+        self.waited += time.perf_counter() - t0
+
+    def close(self):
+        try:
+            self.__enqueue(None)
+            self.__feeder.join()
+        finally:
+            try:
+                self.__process.stdin.close()
+            except OSError:
+                pass
+            code = self.__process.wait()
+        self.__check()
+        if code:
+            raise RuntimeError(f"ffmpeg exited with code {code} writing {self.path}")
+
+    def __enqueue(self, item):
+        # Wait for room in short slices, so a feeder that died is noticed
+        while True:
+            self.__check()
+            try:
+                self.__queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __check(self):
+        if self.error is not None:
+            self.__process.kill()
+            raise RuntimeError(f"ffmpeg stopped taking frames for {self.path}: {self.error}")
+
+    def __feed(self):
+        while True:
+            frame = self.__queue.get()
+            if frame is None:
+                return
+            try:
+                self.__process.stdin.write(frame)
+            except OSError as e: # BrokenPipeError once ffmpeg is gone
+                self.error = e
+                return
+
+def export(sink, frames, every=EXPORT_EVERY_STEPS, size=(SCREEN_WIDTH, SCREEN_HEIGHT), scene_path=None, fps=EXPORT_FPS) -> dict:
+    """
+    Render frames of a CelestialScene, every simulation steps apart, into sink
+    (PngSequence or FfmpegVideo), then return the time spent in each part (seconds)
+    - render: physics, scene update and drawing, on this thread
+    - waited: rendering held up by a full encoder queue
+    """
+    # Imported late so the dummy video driver is already selected
+    import pygame
+    from main import App
+    from scene import CelestialScene
+
+    app = App()
+    scene = CelestialScene(app, run_async=False)
+    if scene_path:
+        scene.load(scene_path)
+    surface = pygame.Surface(size)
+    frame_ms = 1000/fps
+
+    render = 0.0
+    started = time.perf_counter()
+    try:
+        for index in range(frames):
+            t0 = time.perf_counter()
+            if every > 1:
+                scene.simulation.step(every - 1)
+            scene.update(frame_ms) # the last step, mirrored onto the sprites
+            surface.fill(scene.background)
+            scene.draw(surface)
+            frame = pygame.image.tobytes(surface, 'RGB')
+            render += time.perf_counter() - t0
+            sink.put(index, frame)
+        sink.close()
+    finally:
+        scene.close()
+    return {'frames': frames, 'render': render, 'waited': sink.waited, 'total': time.perf_counter() - started}
+
+def main(argv=None):
+    from fonts import cache_path
+
+    parser = argparse.ArgumentParser(description="Render a scene offscreen into PNG frames or a video")
+    parser.add_argument('--scene', metavar='PATH', help="scene to start from, default the last autosave")
+    parser.add_argument('--frames', type=int, default=EXPORT_FPS*10)
+    parser.add_argument('--every', type=int, default=EXPORT_EVERY_STEPS, help="simulation steps between frames")
+    parser.add_argument('--size', type=int, nargs=2, default=(SCREEN_WIDTH, SCREEN_HEIGHT), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--out', default=EXPORT_DIR, help="directory of the PNG sequence")
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS, help="PNG encoder threads")
+    parser.add_argument('--video', metavar='PATH', help="encode a video with ffmpeg instead, PNGs if it is not installed")
+    parser.add_argument('--fps', type=int, default=EXPORT_FPS)
+    args = parser.parse_args(argv)
+
+    scene_path = args.scene
+    if scene_path is None and os.path.exists(cache_path(AUTOSAVE_FILE)):
+        scene_path = cache_path(AUTOSAVE_FILE)
+
+    size = tuple(args.size)
+    ffmpeg = shutil.which('ffmpeg') if args.video else None
+    if args.video and not ffmpeg:
+        print(f"ffmpeg not found, writing PNG frames to {args.out} instead")
+    if ffmpeg:
+        sink = FfmpegVideo(args.video, size, args.fps, ffmpeg=ffmpeg)
+    else:
+        sink = PngSequence(args.out, size, args.workers)
+
+    times = export(sink, args.frames, args.every, size, scene_path, args.fps)
+    print(f"{times['frames']} frames in {times['total']:.2f} s ({times['frames']/times['total']:.1f} fps), "
+          f"rendering {times['render']:.2f} s, waiting on encoders {times['waited']:.2f} s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import json
+import os
+
+import pygame
+
+from constants import FONT_NAME, FONT_SIZE, CACHE_DIR, FONT_CACHE_FILE
+
+def cache_path(name):
+    """
+    Path of a file in the app's cache directory
+    """
+    return os.path.join(os.path.expanduser(CACHE_DIR), name)
+
+def find_font(name, cache_file=None):
+    """
+    Path of an installed font by name, or None for pygame's default font
+    - pygame.font.SysFont scans every font directory on each call, the answer is cached in
+      cache_file so later starts skip the scan; a missing font is cached too (delete the
+      file to search again), a cached path that disappeared is looked up again
+    """
+    cache_file = cache_file or cache_path(FONT_CACHE_FILE)
+    cache = {}
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if name in cache and (cache[name] is None or os.path.exists(cache[name])):
+        return cache[name]
+
+    path = pygame.font.match_font(name)
+    cache[name] = path
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+    return path
+
+def load_font(name=FONT_NAME, size=FONT_SIZE) -> pygame.font.Font:
+    return pygame.font.Font(find_font(name), size)
@@ -0,0 +1,293 @@
+import math
+
+import numpy as np
+
+from constants import DIRECT_BLOCK_SIZE, FORCE_BACKEND, PM_GRID_SIZE, PM_SPLIT_CELLS, PM_CUTOFF_CELLS, PERIODIC_BOX
+from spatial import SpatialGrid
+
+###
+### Direct summation kernels
+###
+
+def field_accelerations(targets : np.ndarray, sources : np.ndarray, mass : np.ndarray, block=DIRECT_BLOCK_SIZE, box=0) -> np.ndarray:
+    """
+    Acceleration at each target point from every source body by direct summation
+    - Same force law as the original per-pair loop: F = m1*m2*r/|r|^3
+    - Targets are processed in blocks so the pair matrix stays at block*N entries
+    - A target sitting exactly on a source (e.g. the self pair) gets nothing from it
+      instead of dividing by zero
+    - Pair terms are computed in the input precision, the per-target sums in float64
+    - With a periodic box every pair uses its minimum image separation
+    """
+    n = len(targets)
+    acc = np.zeros_like(targets)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        d = sources[None, :, :] - targets[start:stop, None, :] # vectors from each target in the block to every source
+        if box:
+            d -= box*np.round(d/box)
+        r2 = d[..., 0]**2 + d[..., 1]**2
+        with np.errstate(divide='ignore'):
+            w = r2 ** -1.5
+        w[r2 == 0] = 0
+        w *= mass[None, :]
+        acc[start:stop, 0] = (d[..., 0] * w).sum(axis=1, dtype=np.float64)
+        acc[start:stop, 1] = (d[..., 1] * w).sum(axis=1, dtype=np.float64)
+    return acc
+
+def direct_accelerations(pos : np.ndarray, mass : np.ndarray, block=DIRECT_BLOCK_SIZE, box=0) -> np.ndarray:
+    """
+    Acceleration on every body from every other body, O(N^2)
+    """
+    return field_accelerations(pos, pos, mass, block, box)
+
+def _periodic_ghosts(points : np.ndarray, box, margin):
+    """
+    Copies of the points within margin of a box edge, shifted a box length to the far side
+    - Returns the ghost positions and the row each one copies
+    """
+    ghosts, rows = [], []
+    for sx in (-1, 0, 1):
+        for sy in (-1, 0, 1):
+            if sx == sy == 0:
+                continue
+            shifted = points + (sx*box, sy*box)
+            near = np.all((shifted > -margin) & (shifted < box + margin), axis=1)
+            ghosts.append(shifted[near])
+            rows.append(np.nonzero(near)[0])
+    return np.concatenate(ghosts), np.concatenate(rows)
+
+###
+### Force backends
+### - accelerations(pos, mass): acceleration on every body from every other body
+### - field(targets, pos, mass): acceleration at arbitrary points (tracers) from the bodies
+### - box: side of the periodic domain [0, box)^2 the backend works in, 0 for open space
+###
+
+class DirectSummation():
+    """
+    Exact pair sums, O(N^2) (O(N*M) for field points)
+    """
+    name = 'direct'
+
+    def __init__(self, box=0):
+        self.box = box
+
+    def accelerations(self, pos, mass):
+        return direct_accelerations(pos, mass, box=self.box)
+
+    def field(self, targets, pos, mass):
+        return field_accelerations(targets, pos, mass, box=self.box)
+
+def _erf(x):
+    """
+    Vectorized erf (Abramowitz & Stegun 7.1.26, |error| < 1.5e-7), NumPy has none
+    """
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1/(1 + 0.3275911*x)
+    poly = t*(0.254829592 + t*(-0.284496736 + t*(1.421413741 + t*(-1.453152027 + t*1.061405429))))
+    return sign*(1 - poly*np.exp(-x*x))
+
+def _long_range_fraction(r, sigma):
+    """
+    Share of the 1/r^2 pair force carried by the mesh when the kernel is split with a
+    Gaussian of width sigma (Ewald split); 1 - this is the short range remainder
+    """
+    q = r/(2*sigma)
+    return _erf(q) - (r/(sigma*math.sqrt(math.pi)))*np.exp(-q*q)
+
+class ParticleMesh():
+    """
+    Particle-mesh gravity for dense, fairly uniform distributions
+    - Masses are deposited on a grid x grid mesh with cloud-in-cell weights, the mesh is
+      convolved with the pair force kernel by FFT (zero padded, so the box is isolated
+      rather than periodic) and accelerations are interpolated back with the same weights
+    - O(N + G^2 log G) per step instead of O(N^2), but forces are smoothed below a few cells
+    - p3m=True splits the kernel: the mesh only carries the smooth long range part and
+      pairs closer than cutoff cells get the exact short range remainder summed directly
+    - With a periodic box the mesh is the box itself, unpadded, and the kernel wraps around
+      with minimum image offsets; short range pairs across an edge are found through ghost
+      copies of the bodies near it
+    """
+    name = 'pm'
+
+    def __init__(self, grid=PM_GRID_SIZE, p3m=False, split=PM_SPLIT_CELLS, cutoff=PM_CUTOFF_CELLS, box=0):
+        self.grid = grid
+        self.p3m = p3m
+        self.split = split      # Gaussian split width, in cells
+        self.cutoff = cutoff    # short range pair distance, in cells
+        self.box = box
+
+        self.__kernel_fft = None
+
+    def accelerations(self, pos, mass):
+        if len(pos) < 2:
+            return np.zeros_like(pos)
+        lo, h = self.__fit(pos)
+        acc = self.__mesh_field(pos, pos, mass, lo, h)
+        if self.p3m:
+            self.__short_range(acc, None, pos, mass, h)
+        return acc
+
+    def field(self, targets, pos, mass):
+        if not len(targets) or not len(pos):
+            return np.zeros_like(targets)
+        lo, h = self.__fit(np.concatenate((pos, targets)))
+        acc = self.__mesh_field(targets, pos, mass, lo, h)
+        if self.p3m:
+            self.__short_range(acc, targets, pos, mass, h)
+        return acc
+
+    ###
+    ### Private functions
+    ###
+
+    def __fit(self, points):
+        """
+        Mesh origin and cell size covering points, with a cell of margin for the CIC stencil
+        - A periodic mesh always covers exactly the box
+        """
+        if self.box:
+            return np.zeros(2), self.box/self.grid
+        lo = points.min(axis=0)
+        span = float((points.max(axis=0) - lo).max())
+        h = span/(self.grid - 3) if span > 0 else 1.0
+        return lo - h, h
+
+    def __kernel(self):
+        """
+        FFT of the x and y pair force kernels in cell units on the zero padded mesh
+        (on the box mesh itself when periodic)
+        - Built once, the physical kernel is this divided by h^2
+        """
+        if self.__kernel_fft is None:
+            m = self.__mesh_size()
+            half = m//2 if self.box else self.grid
+            k = np.arange(m)
+            k = np.where(k < half, k, k - m).astype(np.float64) # signed cell offsets, wrapped
+            dx, dy = np.meshgrid(k, k, indexing='ij')
+            r = np.sqrt(dx**2 + dy**2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                w = r**-3
+            w[0, 0] = 0
+            if self.box:
+                # Offsets of exactly half a box have no minimum image direction, leave them out
+                # so the kernel stays odd and momentum is conserved
+                w[(dx == -half) | (dy == -half)] = 0
+            if self.p3m:
+                w *= _long_range_fraction(r, self.split)
+            self.__kernel_fft = (np.fft.rfft2(dx*w), np.fft.rfft2(dy*w))
+        return self.__kernel_fft
+
+    def __cic(self, points, lo, h):
+        """
+        Lower cell index and the four cloud-in-cell weights of every point
+        """
+        u = (points - lo)/h - 0.5
+        i = np.floor(u).astype(np.intp)
+        f = u - i
+        fx, fy = f[:, 0], f[:, 1]
+        w = ((1-fx)*(1-fy), fx*(1-fy), (1-fx)*fy, fx*fy)
+        return i[:, 0], i[:, 1], w
+
+    def __mesh_size(self):
+        return self.grid if self.box else 2*self.grid
+
+    def __mesh_field(self, targets, sources, mass, lo, h):
+        g = self.grid
+        m = self.__mesh_size()
+
+        # Deposit
+        ix, iy, w = self.__cic(sources, lo, h)
+        rho = np.zeros((m, m))
+        for (ox, oy), wk in zip(((0, 0), (1, 0), (0, 1), (1, 1)), w):
+            cx, cy = ix+ox, iy+oy
+            if self.box:
+                cx, cy = cx % g, cy % g
+            rho[:g, :g] += np.bincount(cx*g + cy, weights=mass*wk, minlength=g*g).reshape(g, g)
+
+        # Solve: a(x_i) = sum_j m_j K(x_j - x_i) = -(rho (*) K)(x_i) since K is odd
+        kx, ky = self.__kernel()
+        rho_fft = np.fft.rfft2(rho)
+        ax = -np.fft.irfft2(rho_fft*kx, s=(m, m))[:g, :g]/h**2
+        ay = -np.fft.irfft2(rho_fft*ky, s=(m, m))[:g, :g]/h**2
+
+        # Interpolate back
+        ix, iy, w = self.__cic(targets, lo, h)
+        acc = np.zeros_like(targets)
+        for (ox, oy), wk in zip(((0, 0), (1, 0), (0, 1), (1, 1)), w):
+            cx, cy = ix+ox, iy+oy
+            if self.box:
+                cx, cy = cx % g, cy % g
+            acc[:, 0] += wk*ax[cx, cy]
+            acc[:, 1] += wk*ay[cx, cy]
+        return acc
+
+    def __short_range(self, acc, targets, sources, mass, h):
+        """
+        Add the short range remainder of the split kernel for pairs within cutoff cells
+        - targets is None when the sources themselves are the targets (forces both ways),
+          otherwise targets are field points appended after the sources in one grid
+        """
+        r_cut = self.cutoff*h
+        n = len(sources)
+        rows = np.arange(n) # source row of every grid point that is a source (or its ghost)
+        if self.box:
+            sources = np.mod(sources, self.box)
+            ghosts, ghost_rows = _periodic_ghosts(sources, self.box, r_cut)
+            sources = np.concatenate((sources, ghosts))
+            rows = np.concatenate((rows, ghost_rows))
+        n_points = len(sources)
+        if targets is None:
+            points = sources
+        else:
+            if self.box:
+                targets = np.mod(targets, self.box)
+            points = np.concatenate((sources, targets))
+
+        grid = SpatialGrid(cell_size=r_cut)
+        grid.update(np.arange(len(points)), points, np.zeros(len(points)))
+        pairs = grid.pairs_within(r_cut)
+        a, b = pairs[:, 0], pairs[:, 1]
+        if targets is None:
+            # A pair across the box edge is found twice, (i, ghost of j) and (ghost of i, j),
+            # keep the copy whose real body has the lower row; ghost-ghost pairs are repeats
+            ga, gb = a >= n, b >= n
+            keep = (~ga & ~gb) | (ga & ~gb & (b < rows[a])) | (gb & ~ga & (a < rows[b]))
+            a, b = a[keep], b[keep]
+        else:
+            # Only source -> field point pairs, oriented (field point, source)
+            a, b = np.where(a >= n_points, a, b), np.where(a >= n_points, b, a)
+            keep = (a >= n_points) & (b < n_points)
+            a, b = a[keep], b[keep]
+        if not len(a):
+            return
+
+        d = points[b] - points[a]
+        r = np.sqrt(d[:, 0]**2 + d[:, 1]**2)
+        nonzero = r > 0
+        a, b, d, r = a[nonzero], b[nonzero], d[nonzero], r[nonzero]
+        f = (1 - _long_range_fraction(r/h, self.split))/r**3
+        fx, fy = d[:, 0]*f, d[:, 1]*f
+
+        if targets is None:
+            a, b = rows[a], rows[b]
+            acc[:, 0] += np.bincount(a, weights=mass[b]*fx, minlength=n) - np.bincount(b, weights=mass[a]*fx, minlength=n)
+            acc[:, 1] += np.bincount(a, weights=mass[b]*fy, minlength=n) - np.bincount(b, weights=mass[a]*fy, minlength=n)
+        else:
+            a, b = a - n_points, rows[b]
+            acc[:, 0] += np.bincount(a, weights=mass[b]*fx, minlength=len(targets))
+            acc[:, 1] += np.bincount(a, weights=mass[b]*fy, minlength=len(targets))
+
+def make_backend(name=FORCE_BACKEND, box=PERIODIC_BOX):
+    """
+    Force backend by name: 'direct', 'pm' or 'p3m', for a periodic box of that side (0 for none)
+    """
+    if name == 'direct':
+        return DirectSummation(box)
+    if name == 'pm':
+        return ParticleMesh(box=box)
+    if name == 'p3m':
+        return ParticleMesh(p3m=True, box=box)
+    raise ValueError(f"Unknown force backend: {name}")
@@ -0,0 +1,73 @@
+import pygame
+
+from constants import HUD_REFRESH_MS, HUD_MARGIN, HUD_SPACING
+from objects import TransientDrawEntity, TextObject
+
+class HudWidget(TextObject):
+    """
+    Live stat display
+    - Polls source() at most every `interval` ms and formats it with `fmt`
+    - Only re-renders when the formatted text differs from what is shown
+    """
+    def __init__(self, source, font : pygame.font.Font, color, fmt='{}', interval=HUD_REFRESH_MS, **kwargs):
+        super().__init__(fmt.format(source()), font, color, **kwargs)
+        self.source = source
+        self.fmt = fmt
+        self.interval = interval
+
+        self.__elapsed = 0
+
+    def refresh(self):
+        """
+        Poll the source immediately
+        """
+        self.__elapsed = 0
+        self.text = self.fmt.format(self.source())
+
+    def update(self, dt):
+        super().update(dt)
+        self.__elapsed += dt
+        if self.__elapsed >= self.interval:
+            self.refresh()
+
+class Hud(TransientDrawEntity):
+    """
+    Stack of text widgets anchored to a corner of the screen
+    - anchor is one of 'topleft', 'topright', 'bottomleft', 'bottomright'
+    """
+    def __init__(self, anchor='topleft', margin=HUD_MARGIN, spacing=HUD_SPACING):
+        super().__init__()
+        self.anchor = anchor
+        self.margin = margin
+        self.spacing = spacing
+
+        self.widgets : list[TextObject] = []
+
+    def add(self, widget : TextObject) -> TextObject:
+        self.widgets.append(widget)
+        return widget
+
+    def remove(self, widget : TextObject):
+        if widget in self.widgets:
+            self.widgets.remove(widget)
+
+    def update(self, dt):
+        for w in self.widgets:
+            w.update(dt)
+
+    def draw(self, surface : pygame.Surface, offset=(0, 0)):
+        super().draw(surface, offset)
+        sw, sh = surface.get_size()
+        right = self.anchor.endswith('right')
+        bottom = self.anchor.startswith('bottom')
+
+        # Lay the widgets out top to bottom (or bottom to top) from the anchor corner
+        y = sh - self.margin if bottom else self.margin
+        for w in self.widgets:
+            width, height = w.size
+            if bottom:
+                y -= height
+            x = sw - width - self.margin if right else self.margin
+            w.position = (x, y)
+            w.draw(surface)
+            y = y - self.spacing if bottom else y + height + self.spacing
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+import json
 import pygame
 import weakref
 
@@ -52,6 +53,10 @@ class MouseMove(ButtonInput):
         return True
 
 class Inputs():
+    # Shared by every instance: states replace app.inputs, but there is one event stream
+    recorder : 'InputRecorder' = None
+    mouse_pos = (0, 0)   # last pointer position seen in the event stream
+
     def __init__(self):
         self.inputs = {}
 
@@ -59,13 +64,90 @@ class Inputs():
         for i in self.inputs.values():
             i.update(dt)
 
+        if Inputs.recorder:
+            Inputs.recorder.next_frame()
+
     def register(self, name, button):
         self.inputs[name] = button
 
     def handle_events(self, events):
+        if Inputs.recorder:
+            Inputs.recorder.record(events)
+
+        for event in events:
+            if event.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                Inputs.mouse_pos = tuple(event.pos)
+
         for i in self.inputs.values():
             i.process_events(events)
 
+###
+### Recording and replay
+###
+
+# Event types and attributes worth recording, everything Inputs can match on
+RECORDED_EVENTS = (pygame.KEYDOWN, pygame.KEYUP, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION)
+RECORDED_FIELDS = ('key', 'mod', 'button', 'buttons', 'pos', 'rel')
+
+def _open_text(path, mode):
+    import gzip # only needed when recording or replaying
+    return gzip.open(path, mode + 't') if str(path).endswith('.gz') else open(path, mode)
+
+class InputRecorder():
+    """
+    Writes the event stream reaching Inputs to a file, for replay.py
+    - JSON lines (gzipped when the path ends in .gz): a header with the starting pointer
+      position, then [frame, [[type, {field: value}], ...]] for each frame that had events,
+      then the frame count
+    - The frame index advances on every Inputs.update, i.e. once per frame
+    """
+    def __init__(self, path):
+        self.path = path
+        self.frame = 0
+        self.__file = _open_text(path, 'w')
+        self.__write({'version': 1, 'mouse': list(Inputs.mouse_pos)})
+
+    def record(self, events):
+        recorded = []
+        for event in events:
+            if event.type in RECORDED_EVENTS:
+                fields = {k: v for k, v in event.dict.items() if k in RECORDED_FIELDS}
+                recorded.append([event.type, fields])
+        if recorded:
+            self.__write([self.frame, recorded])
+
+    def next_frame(self):
+        self.frame += 1
+
+    def close(self):
+        if self.__file:
+            self.__write({'frames': self.frame})
+            self.__file.close()
+            self.__file = None
+
+    def __write(self, obj):
+        self.__file.write(json.dumps(obj, separators=(',', ':')) + '\n')
+
+def load_recording(path):
+    """
+    Read a file written by InputRecorder
+    - Returns the header, {frame: [pygame.event.Event]} and the number of frames
+    """
+    frames = {}
+    header, count = {}, 0
+    with _open_text(path, 'r') as f:
+        for line in f:
+            obj = json.loads(line)
+            if isinstance(obj, dict):
+                header.update(obj)
+                count = obj.get('frames', count)
+                continue
+            frame, events = obj
+            frames[frame] = [pygame.event.Event(t, {k: tuple(v) if isinstance(v, list) else v for k, v in fields.items()}) for t, fields in events]
+    if not count and frames:
+        count = max(frames) + 1
+    return header, frames, count
+
 class Button():
     def __init__(self, button_type, button):
         if button_type in (pygame.KEYDOWN, pygame.KEYUP):
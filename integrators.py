@@ -0,0 +1,225 @@
+import numpy as np
+
+from constants import INTEGRATOR, WH_MASS_RATIO
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+###
+### Integrators
+### - step(sim, dt): advance the bodies (and tracers) of a Simulation in place by dt
+###
+
+class EulerIntegrator():
+    """
+    Euler step over all bodies at once (same update as the old per-object integrator)
+    """
+    name = 'euler'
+
+    def step(self, sim : 'Simulation', dt):
+        pos, vel, acc = sim.pos, sim.vel, sim.acc
+        acc[:] = sim.forces.accelerations(pos, sim.mass)
+
+        # Tracers only see the bodies, evaluated before the bodies move
+        if sim.tracer_count:
+            tpos, tvel = sim.tracer_pos, sim.tracer_vel
+            tacc = sim.forces.field(tpos, pos, sim.mass)
+            tpos += tvel * dt + 0.5 * tacc * dt
+            tvel += tacc * dt
+
+        pos += vel * dt + 0.5 * acc * dt
+        vel += acc * dt
+
+def _stumpff(z):
+    """
+    Stumpff functions C(z) and S(z) for any sign of z, with series near 0
+    """
+    c = np.empty_like(z)
+    s = np.empty_like(z)
+    small = np.abs(z) < 1e-3
+    ell = (z > 0) & ~small
+    hyp = (z < 0) & ~small
+
+    zs = z[small]
+    c[small] = 1/2 - zs/24 + zs**2/720
+    s[small] = 1/6 - zs/120 + zs**2/5040
+
+    sq = np.sqrt(z[ell])
+    c[ell] = (1 - np.cos(sq))/z[ell]
+    s[ell] = (sq - np.sin(sq))/sq**3
+
+    sq = np.sqrt(-z[hyp])
+    c[hyp] = (np.cosh(sq) - 1)/-z[hyp]
+    s[hyp] = (np.sinh(sq) - sq)/sq**3
+    return c, s
+
+def kepler_drift(r0 : np.ndarray, v0 : np.ndarray, mu, dt, tol=1e-12, max_iter=50):
+    """
+    Advance two-body orbits around a fixed mass mu by dt
+    - r0, v0 are (N, 2) positions and velocities relative to the central body
+    - Universal variable formulation, so elliptic, parabolic and hyperbolic orbits share
+      one vectorized Laguerre-Conway solve
+    - Returns new (r, v); points sitting on the center are left where they are
+    """
+    r = r0.copy()
+    v = v0.copy()
+    r0n = np.sqrt(r0[:, 0]**2 + r0[:, 1]**2)
+    ok = r0n > 0
+    if not ok.any() or mu <= 0:
+        r += v0 * dt
+        return r, v
+    r0, v0, r0n = r0[ok], v0[ok], r0n[ok]
+
+    smu = np.sqrt(mu)
+    v2 = v0[:, 0]**2 + v0[:, 1]**2
+    rv = (r0[:, 0]*v0[:, 0] + r0[:, 1]*v0[:, 1])/smu
+    alpha = 2/r0n - v2/mu # 1/a, negative when hyperbolic
+
+    # Elliptic-style first guess, it only has to land somewhere Laguerre-Conway converges from
+    x = smu*dt*np.where(np.abs(alpha) > 1e-12, np.abs(alpha), 1/r0n)
+    n = 5
+    for _ in range(max_iter):
+        z = alpha*x*x
+        c, s = _stumpff(z)
+        f = rv*x*x*c + (1 - alpha*r0n)*x**3*s + r0n*x - smu*dt
+        fp = rv*x*(1 - z*s) + (1 - alpha*r0n)*x*x*c + r0n
+        fpp = rv*(1 - z*c) + (1 - alpha*r0n)*x*(1 - z*s)
+        root = np.sqrt(np.abs((n-1)**2*fp*fp - n*(n-1)*f*fpp))
+        delta = n*f/(fp + np.sign(fp)*root)
+        x -= delta
+        if np.all(np.abs(delta) <= tol*np.maximum(1, np.abs(x))):
+            break
+
+    z = alpha*x*x
+    c, s = _stumpff(z)
+    fl = 1 - x*x/r0n*c
+    gl = dt - x**3/smu*s
+    rn = fl[:, None]*r0 + gl[:, None]*v0
+    rnn = np.sqrt(rn[:, 0]**2 + rn[:, 1]**2)
+    fdot = smu/(rnn*r0n)*(z*x*s - x)
+    gdot = 1 - x*x/rnn*c
+    r[ok] = rn
+    v[ok] = fdot[:, None]*r0 + gdot[:, None]*v0
+    return r, v
+
+def dominant_body(mass : np.ndarray, ratio=WH_MASS_RATIO):
+    """
+    Row of the body holding at least `ratio` of the total mass, or None
+    """
+    if len(mass) < 2:
+        return None
+    i = int(np.argmax(mass))
+    total = float(mass.sum())
+    return i if total > 0 and mass[i] >= ratio*total else None
+
+class WisdomHolman():
+    """
+    Wisdom-Holman mixed variable symplectic integrator (democratic heliocentric form)
+    - For scenes dominated by one central mass: the Keplerian part of every orbit is
+      advanced exactly by kepler_drift, body-body interactions (through the force backend)
+      and the central body's recoil are applied as kicks around it
+    - Stable at steps far larger than Euler needs, but close encounters between the
+      orbiting bodies are only as accurate as the kick
+    - Tracers are advanced as massless orbiting bodies
+    - Works in float64 whatever the storage precision, the Kepler solve needs it
+    - Needs an open world, orbits around one center have no meaning in a periodic box
+    """
+    name = 'wh'
+
+    def step(self, sim : 'Simulation', dt):
+        if sim.box:
+            raise ValueError("Wisdom-Holman can not integrate a periodic box")
+        pos, vel, mass = (a.astype(np.float64) for a in (sim.pos, sim.vel, sim.mass))
+        if not len(mass):
+            return
+        c = int(np.argmax(mass))
+
+        m0 = mass[c]
+        others = np.arange(len(mass)) != c
+        mp = mass[others]
+        total = float(mass.sum())
+
+        # To heliocentric positions and barycentric velocities
+        x_cm = (mass[:, None]*pos).sum(axis=0)/total
+        v_cm = (mass[:, None]*vel).sum(axis=0)/total
+        q = pos[others] - pos[c]
+        u = vel[others] - v_cm
+        tq = sim.tracer_pos.astype(np.float64) - pos[c]
+        tu = sim.tracer_vel.astype(np.float64) - v_cm
+
+        half = dt/2
+        self.__kick(sim, q, u, tq, tu, mp, half)
+        self.__jump(q, u, tq, mp, m0, half)
+        q, u = kepler_drift(q, u, m0, dt)
+        tq, tu = kepler_drift(tq, tu, m0, dt)
+        self.__jump(q, u, tq, mp, m0, half)
+        a_int = self.__kick(sim, q, u, tq, tu, mp, half)
+
+        # Back to inertial coordinates
+        x_cm += v_cm*dt
+        x0 = x_cm - (mp[:, None]*q).sum(axis=0)/total
+        pos[c] = x0
+        pos[others] = q + x0
+        vel[c] = v_cm - (mp[:, None]*u).sum(axis=0)/m0
+        vel[others] = u + v_cm
+        sim.pos[:] = pos
+        sim.vel[:] = vel
+        sim.tracer_pos[:] = tq + x0
+        sim.tracer_vel[:] = tu + v_cm
+
+        # Acceleration for display: interactions plus the central pull (and its reaction)
+        r3 = np.sum(q**2, axis=1)**1.5
+        central = q/np.where(r3 > 0, r3, np.inf)[:, None]
+        sim.acc[others] = a_int - m0*central
+        sim.acc[c] = (mp[:, None]*central).sum(axis=0)
+
+    def __kick(self, sim, q, u, tq, tu, mp, dt):
+        """
+        Interaction kick between the orbiting bodies, in place; returns their accelerations
+        """
+        a = sim.forces.accelerations(q, mp) if len(mp) > 1 else np.zeros_like(q)
+        u += a*dt
+        # Tracers feel every orbiting body, a single planet included
+        if len(tq) and len(mp):
+            tu += sim.forces.field(tq, q, mp)*dt
+        return a
+
+    def __jump(self, q, u, tq, mp, m0, dt):
+        """
+        Drift from the central body's momentum, the same shift for every orbiting point
+        """
+        shift = (mp[:, None]*u).sum(axis=0)/m0*dt
+        q += shift
+        tq += shift
+
+class AutoIntegrator():
+    """
+    Wisdom-Holman while one body dominates the mass (star with planets), Euler otherwise
+    - Re-checked every step so drawing or losing the big body switches method
+    - Always Euler in a periodic box
+    """
+    name = 'auto'
+
+    def __init__(self, ratio=WH_MASS_RATIO):
+        self.ratio = ratio
+        self.euler = EulerIntegrator()
+        self.wh = WisdomHolman()
+        self.active = self.euler
+
+    def step(self, sim : 'Simulation', dt):
+        central = not sim.box and dominant_body(sim.mass, self.ratio) is not None
+        self.active = self.wh if central else self.euler
+        self.active.step(sim, dt)
+
+def make_integrator(name=INTEGRATOR):
+    """
+    Integrator by name: 'euler', 'wh' or 'auto'
+    """
+    if name == 'euler':
+        return EulerIntegrator()
+    if name == 'wh':
+        return WisdomHolman()
+    if name == 'auto':
+        return AutoIntegrator()
+    raise ValueError(f"Unknown integrator: {name}")
@@ -1,8 +1,16 @@
+import time
+STARTED = time.perf_counter() # process start, for the startup time report
+
+import argparse
+
 import pygame
 
-from states import MenuState, DrawState
-from inputs import Inputs
-from constants import WINDOW_TITLE, SCREEN_WIDTH, SCREEN_HEIGHT, FPS_CAP
+from states import MenuState, DrawState, StateManager
+from inputs import Inputs, InputRecorder
+from hud import Hud, HudWidget
+from objects import TextObject
+from fonts import load_font
+from constants import WINDOW_TITLE, SCREEN_WIDTH, SCREEN_HEIGHT, FPS_CAP, WARP_HUD_MS, NET_HOST
 
 class App():
     STATES = {
@@ -10,25 +18,45 @@ class App():
         'draw' : DrawState
     }
 
-    def __init__(self, init_state = 'menu'):
-        # Init pygame
-        pygame.init()
+    def __init__(self, init_state = 'menu', report_startup = False):
+        # Time of each startup stage, reported after the first frame when asked for
+        self.report_startup = report_startup
+        self.__startup = [('imports', time.perf_counter())]
+
+        # Init only the pygame modules in use, pygame.init() would also start audio, joystick...
+        pygame.display.init()
+        pygame.font.init()
+        self.__startup.append(('pygame init', time.perf_counter()))
 
         # Get clock
         self.clock = pygame.time.Clock()
 
         # Create screen
         self.__screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.__startup.append(('display', time.perf_counter()))
+
+        # Main app font, its path is looked up once and cached across runs
+        self.font = load_font()
+        self.__startup.append(('font', time.perf_counter()))
 
-        # Main app font
-        self.font = pygame.font.SysFont("Arial", 16, False, False)
+        # Screen overlay, fps counter is polled rather than rendered every frame
+        self.hud = Hud(anchor='topright')
+        self.hud.add(HudWidget(lambda: round(self.clock.get_fps()), self.font, (0,0,0), fmt='{} FPS'))
 
-        # Input pipeline (instance gets replaced by each state init())
+        # Status line drawn instead of frames while the state suspends drawing (time warp)
+        self.__status = TextObject('', self.font, (0,0,0))
+        self.__status_elapsed = WARP_HUD_MS
+
+        # Input pipeline (the active state's bindings, swapped on every state change)
         self.inputs = Inputs()
+        Inputs.mouse_pos = pygame.mouse.get_pos()
 
         # Persistent data dictionary, for data to persist across state change
         self.__data = {}
 
+        # States are built once and kept while suspended
+        self.states = StateManager(self, self.STATES)
+
         # Current state
         self.__state = None
         # Next state name
@@ -72,6 +100,7 @@ class App():
             for event in events:
                 # Handle Quit
                 if event.type == pygame.QUIT:
+                    self.states.close()
                     pygame.quit()
                     return 0
             
@@ -86,19 +115,39 @@ class App():
             
             # Update the system
             self.update(delta_time)
+
+            # Draw next frame, or just a status line now and then while drawing is suspended
+            if self.__state.draw_suspended:
+                self.draw_status(delta_time)
+                continue
+            self.__status_elapsed = WARP_HUD_MS
+
+            # Update the overlay
+            self.hud.update(delta_time)
             
             # Draw next frame
             self.draw_frame()
 
+            if self.__startup:
+                self.__startup.append(('first frame', time.perf_counter()))
+                if self.report_startup:
+                    self.print_startup()
+                    self.states.close()
+                    pygame.quit()
+                    return 0
+                self.__startup = None
+
     def update(self, delta_time):
         """
         Update state of the system
         """
         if self.__next_state:
-            self.__state = self.STATES[self.__next_state.lower()](self)
+            self.__state = self.states.switch(self.__next_state)
+            self.inputs = self.__state.inputs
             self.__next_state = ''
-        else:
-            self.__state.update(delta_time)
+            if self.__startup:
+                self.__startup.append((f'{self.__state.__class__.__name__} built', time.perf_counter()))
+        self.__state.update(delta_time)
 
     def draw_frame(self):
         """
@@ -111,21 +160,61 @@ class App():
         # Call .draw() func of state
         self.__state.draw() # For transient drawing to the screen, (arrows)
         
-        # Draw fps to screen
-        self.__draw_fps()
+        # Draw overlay (fps) to screen
+        self.hud.draw(self.__screen)
         
         # Update the display
         pygame.display.update()
 
-    def __draw_fps(self):
+    def print_startup(self):
         """
-        Draw fps to screen
+        Time from process start to each startup stage
         """
-        txt = f'{round(self.clock.get_fps())} FPS'
-        rtxt = self.font.render(txt, False, pygame.Color('black'))
-        rsiz = self.font.size(txt)
-        self.__screen.blit(rtxt, (SCREEN_WIDTH-rsiz[0]-5, 5))     
+        previous = STARTED
+        for stage, at in self.__startup:
+            print(f"{stage:>16} {(at - previous)*1000:8.1f} ms")
+            previous = at
+        print(f"{'total':>16} {(previous - STARTED)*1000:8.1f} ms")
+
+    def draw_status(self, delta_time):
+        """
+        Minimal frame with only the state's status text, at most every WARP_HUD_MS
+        """
+        self.__status_elapsed += delta_time
+        if self.__status_elapsed < WARP_HUD_MS:
+            return
+        self.__status_elapsed = 0
+
+        self.__screen.fill(self.__state.scene_bg)
+        self.__status.text = self.__state.status_text
+        self.__status.draw(self.__screen)
+        pygame.display.update()
 
-app = App('draw')   # Start app in "draw" state, default is menu but no menu yet
-app.run()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=WINDOW_TITLE)
+    parser.add_argument('--record', metavar='PATH', help="record the input events to PATH (.gz to compress) for replay.py")
+    parser.add_argument('--scene', metavar='PATH', help="warm start from a scene saved with F5")
+    parser.add_argument('--fresh', action='store_true', help="start empty instead of resuming from the last autosave")
+    parser.add_argument('--connect', metavar='HOST:PORT', help="view a simulation served by network.py instead of running one")
+    parser.add_argument('--startup-time', action='store_true', help="print how long startup took and exit after the first frame")
+    args = parser.parse_args()
+
+    if args.record:
+        Inputs.recorder = InputRecorder(args.record)
+
+    app = App('draw', args.startup_time)   # Start app in "draw" state, default is menu but no menu yet
+    if args.scene:
+        app.data['scene_path'] = args.scene
+    if args.fresh:
+        app.data['fresh'] = True
+    if args.startup_time:
+        app.data['autosave'] = False # a timing run leaves the user's autosave alone
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        app.data['connect'] = (host or NET_HOST, int(port))
+    try:
+        app.run()
+    finally:
+        if Inputs.recorder:
+            Inputs.recorder.close()
 
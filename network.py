@@ -0,0 +1,382 @@
+"""
+Run the simulation headless as a server and view it from another process
+
+Usage:
+    python network.py --port 7777 --scene scene.npz   (physics, no window)
+    python main.py --connect 127.0.0.1:7777            (viewer)
+
+The server steps a Simulation on a SimulationWorker, the same physics CelestialScene runs,
+and streams it to every connected viewer as quantized, delta encoded position updates.
+Viewers draw the stream with a normal CelestialScene and send body creation back.
+"""
+import argparse
+import asyncio
+import json
+import struct
+import threading
+
+import numpy as np
+
+from constants import NET_HOST, NET_PORT, NET_SEND_HZ, NET_POS_QUANTUM, NET_MOVE_THRESHOLD, NET_HIGH_WATER, SIM_RATE_HZ
+from simulation import Simulation, SimulationWorker
+from checkpoint import read_snapshot
+
+###
+### Wire format
+### - Every message is a little endian uint32 length, then a type byte and the payload
+### - FRAME (server -> viewer): steps, time, update and removed counts, then the updated
+###   bodies as UPDATE_DTYPE records and the removed ids as int64
+### - COMMAND (viewer -> server): a JSON object {'cmd': name, ...}
+###
+
+MSG_FRAME = 1
+MSG_COMMAND = 2
+
+LENGTH = struct.Struct('<I')
+FRAME_HEADER = struct.Struct('<qdII')
+UPDATE_DTYPE = np.dtype([('id', '<i8'), ('pos', '<i4', 2), ('vel', '<f4', 2), ('acc', '<f4', 2), ('radius', '<f4')])
+
+def pack(kind, payload : bytes) -> bytes:
+    return LENGTH.pack(len(payload) + 1) + bytes((kind,)) + payload
+
+async def read_message(reader : asyncio.StreamReader):
+    """
+    Next (type, payload) from a stream, IncompleteReadError once it is closed
+    """
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    body = await reader.readexactly(length)
+    return body[0], body[1:]
+
+class QuantizedFrame():
+    """
+    A published simulation frame, sorted by id, positions in steps of quantum
+    - Copies out of the SimulationFrame, which the worker reuses
+    """
+    def __init__(self, frame, quantum=NET_POS_QUANTUM):
+        order = np.argsort(frame.ids, kind='stable')
+        self.steps = frame.steps
+        self.time = frame.time
+        self.ids = frame.ids[order]
+        self.q = np.round(frame.pos[order]/quantum).astype(np.int32)
+        self.vel = frame.vel[order]
+        self.acc = frame.acc[order]
+        self.radius = frame.radius[order]
+
+class DeltaEncoder():
+    """
+    Turns frames into the FRAME payloads for one viewer
+    - A body is sent when it is new to the viewer, or has moved more than threshold quanta
+      from where this viewer last saw it; bodies gone since the last payload go as removed ids
+    - Deltas are against what was last sent, not the previous frame, so a frame dropped for a
+      slow viewer costs it time resolution only
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.__ids = np.zeros(0, dtype=np.int64)
+        self.__q = np.zeros((0, 2), dtype=np.int32)
+
+    def encode(self, frame : QuantizedFrame) -> bytes:
+        n = len(self.__ids)
+        idx = np.searchsorted(self.__ids, frame.ids)
+        known = idx < n
+        known[known] = self.__ids[idx[known]] == frame.ids[known]
+
+        moved = ~known
+        moved[known] = np.abs(frame.q[known] - self.__q[idx[known]]).max(axis=1) > self.threshold
+        removed = self.__ids[~np.isin(self.__ids, frame.ids, assume_unique=True)]
+
+        # What the viewer has after this payload
+        q = frame.q.copy()
+        kept = ~moved
+        q[kept] = self.__q[idx[kept]]
+        self.__ids, self.__q = frame.ids, q
+
+        records = np.zeros(np.count_nonzero(moved), dtype=UPDATE_DTYPE)
+        records['id'] = frame.ids[moved]
+        records['pos'] = frame.q[moved]
+        records['vel'] = frame.vel[moved]
+        records['acc'] = frame.acc[moved]
+        records['radius'] = frame.radius[moved]
+        header = FRAME_HEADER.pack(frame.steps, frame.time, len(records), len(removed))
+        return header + records.tobytes() + removed.astype('<i8').tobytes()
+
+class RemoteFrame():
+    """
+    The viewer's copy of the server's bodies, with what CelestialScene reads off a SimulationFrame
+    - apply() returns a new frame, so the render loop can keep one while the next is decoded
+    """
+    def __init__(self):
+        self.steps = 0
+        self.time = 0.0
+        self.revision = 0 # one per applied payload, bodies may come and go in any of them
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.pos = np.zeros((0, 2))
+        self.vel = np.zeros((0, 2))
+        self.acc = np.zeros((0, 2))
+        self.radius = np.zeros(0)
+        self.tracer_pos = np.zeros((0, 2))
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+    def apply(self, payload : bytes, quantum=NET_POS_QUANTUM) -> 'RemoteFrame':
+        steps, t, n, k = FRAME_HEADER.unpack_from(payload)
+        offset = FRAME_HEADER.size
+        records = np.frombuffer(payload, UPDATE_DTYPE, n, offset)
+        removed = np.frombuffer(payload, '<i8', k, offset + n*UPDATE_DTYPE.itemsize)
+
+        # Bodies neither removed nor updated carry over
+        stale = ~np.isin(self.ids, removed) & ~np.isin(self.ids, records['id'])
+        ids = np.concatenate((self.ids[stale], records['id']))
+        order = np.argsort(ids, kind='stable')
+
+        frame = RemoteFrame()
+        frame.steps = steps
+        frame.time = t
+        frame.revision = self.revision + 1
+        frame.ids = ids[order]
+        frame.pos = np.concatenate((self.pos[stale], records['pos']*quantum))[order]
+        frame.vel = np.concatenate((self.vel[stale], records['vel']))[order]
+        frame.acc = np.concatenate((self.acc[stale], records['acc']))[order]
+        frame.radius = np.concatenate((self.radius[stale], records['radius']))[order]
+        return frame
+
+###
+### Server
+###
+
+class ViewerConnection():
+    """
+    Sending side of one viewer
+    - offer() puts a frame in a one slot mailbox; a frame replaced before the sender took it is
+      dropped, so a viewer that is slow to read gets fewer frames rather than a backlog
+    - The sender waits on writer.drain(), which only blocks past the transport's high water mark
+    """
+    def __init__(self, writer : asyncio.StreamWriter, threshold):
+        self.writer = writer
+        self.encoder = DeltaEncoder(threshold)
+        self.sent = 0
+        self.dropped = 0
+
+        self.__frame = None
+        self.__ready = asyncio.Event()
+
+    def offer(self, frame : QuantizedFrame):
+        if self.__frame is not None:
+            self.dropped += 1
+        self.__frame = frame
+        self.__ready.set()
+
+    async def send_frames(self):
+        while True:
+            await self.__ready.wait()
+            self.__ready.clear()
+            frame, self.__frame = self.__frame, None
+            self.writer.write(pack(MSG_FRAME, self.encoder.encode(frame)))
+            await self.writer.drain()
+            self.sent += 1
+
+class SimulationServer():
+    """
+    Steps a Simulation on a SimulationWorker and streams it to viewers over TCP
+    - The asyncio loop samples the worker's FrameBuffer at send_hz, the worker never waits
+      on the network
+    - Viewer commands (add_body, clear) run on the worker between steps
+    - port 0 picks a free port, the chosen one is in .port once serving
+    """
+    def __init__(self, simulation : Simulation, host=NET_HOST, port=NET_PORT, rate_hz=SIM_RATE_HZ, send_hz=NET_SEND_HZ,
+                 quantum=NET_POS_QUANTUM, threshold=NET_MOVE_THRESHOLD, high_water=NET_HIGH_WATER):
+        self.simulation = simulation
+        self.worker = SimulationWorker(simulation, rate_hz)
+        self.host = host
+        self.port = port
+        self.send_hz = send_hz
+        self.quantum = quantum
+        self.threshold = threshold
+        self.high_water = high_water
+
+        self.listening = threading.Event()
+        self.__viewers = set()
+        self.__latest = None
+
+    async def serve(self):
+        self.worker.start()
+        server = await asyncio.start_server(self.__viewer, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Serving the simulation on {self.host}:{self.port}")
+        self.listening.set()
+        try:
+            async with server:
+                await self.__publish()
+        finally:
+            self.worker.stop()
+
+    ###
+    ### Private functions
+    ###
+
+    async def __publish(self):
+        period = 1/self.send_hz
+        while True:
+            frame = self.worker.buffer.read()
+            if frame is not None:
+                self.__latest = QuantizedFrame(frame, self.quantum)
+                for viewer in self.__viewers:
+                    viewer.offer(self.__latest)
+            await asyncio.sleep(period)
+
+    async def __viewer(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.high_water)
+        viewer = ViewerConnection(writer, self.threshold/self.quantum)
+        if self.__latest is not None:
+            viewer.offer(self.__latest)
+        self.__viewers.add(viewer)
+        sender = asyncio.create_task(viewer.send_frames())
+
+        peer = writer.get_extra_info('peername')
+        print(f"Viewer connected: {peer}")
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == MSG_COMMAND:
+                    self.__command(json.loads(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.__viewers.discard(viewer)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            writer.close()
+            print(f"Viewer disconnected: {peer}, {viewer.sent} frames sent, {viewer.dropped} dropped")
+
+    def __command(self, cmd : dict):
+        name = cmd.get('cmd')
+        if name == 'add_body':
+            self.worker.submit(self.simulation.add_body, tuple(cmd['pos']), tuple(cmd['vel']), float(cmd['mass']), float(cmd['radius']))
+        elif name == 'clear':
+            self.worker.submit(self.simulation.clear)
+        else:
+            print(f"Unknown command from viewer: {name}")
+
+###
+### Viewer
+###
+
+class SimulationClient(threading.Thread):
+    """
+    Viewer side of SimulationServer, running its own asyncio loop on a background thread
+    - read() hands the render loop the newest frame like FrameBuffer.read(), None if nothing new
+    - add_body() and clear() send commands and can be called from any thread
+    """
+    def __init__(self, host=NET_HOST, port=NET_PORT, quantum=NET_POS_QUANTUM):
+        super().__init__(name="simulation-client", daemon=True)
+        self.host = host
+        self.port = port
+        self.quantum = quantum
+        self.frames = 0
+        self.error = None
+
+        self.__loop = None
+        self.__task = None
+        self.__writer = None
+        self.__connected = threading.Event()
+
+        self.__lock = threading.Lock()
+        self.__frame = RemoteFrame()
+        self.__fresh = False
+
+    def connect(self, timeout=5.0):
+        """
+        Start the thread and wait for the connection, raises what connecting raised
+        """
+        self.start()
+        if not self.__connected.wait(timeout):
+            raise TimeoutError(f"No answer from {self.host}:{self.port}")
+        if self.error:
+            raise self.error
+
+    def read(self) -> RemoteFrame:
+        with self.__lock:
+            if not self.__fresh:
+                return None
+            self.__fresh = False
+            return self.__frame
+
+    def send(self, cmd : dict):
+        if self.__writer is not None:
+            self.__loop.call_soon_threadsafe(self.__writer.write, pack(MSG_COMMAND, json.dumps(cmd).encode()))
+
+    def add_body(self, position, velocity, mass, radius):
+        self.send({'cmd': 'add_body', 'pos': list(position), 'vel': list(velocity), 'mass': mass, 'radius': radius})
+
+    def clear(self):
+        self.send({'cmd': 'clear'})
+
+    def close(self, timeout=1.0):
+        if self.__task is not None:
+            self.__loop.call_soon_threadsafe(self.__task.cancel)
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        try:
+            asyncio.run(self.__receive())
+        except asyncio.CancelledError:
+            pass # closed while still connecting
+
+    ###
+    ### Private functions
+    ###
+
+    async def __receive(self):
+        self.__loop = asyncio.get_running_loop()
+        self.__task = asyncio.current_task()
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            self.error = e
+            self.__connected.set()
+            return
+        self.__writer = writer
+        self.__connected.set()
+
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                if kind != MSG_FRAME:
+                    continue
+                frame = self.__frame.apply(payload, self.quantum) # only this thread replaces __frame
+                with self.__lock:
+                    self.__frame = frame
+                    self.__fresh = True
+                self.frames += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("Disconnected from the simulation server")
+        except asyncio.CancelledError:
+            pass
+        finally:
+            writer.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the simulation to viewers (python main.py --connect HOST:PORT)")
+    parser.add_argument('--host', default=NET_HOST)
+    parser.add_argument('--port', type=int, default=NET_PORT)
+    parser.add_argument('--scene', metavar='PATH', help="start from a scene saved with F5")
+    parser.add_argument('--rate-hz', type=float, default=SIM_RATE_HZ, help="physics steps per second, 0 = flat out")
+    parser.add_argument('--send-hz', type=float, default=NET_SEND_HZ, help="frames per second offered to each viewer")
+    args = parser.parse_args(argv)
+
+    simulation = Simulation()
+    if args.scene:
+        simulation.restore(read_snapshot(args.scene))
+        print(f"Loaded {simulation.count} bodies from {args.scene}")
+
+    server = SimulationServer(simulation, args.host, args.port, args.rate_hz, args.send_hz)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,9 @@ import glm
 from glm import vec2, vec3, vec4, mat4
 
 import math
+from collections import OrderedDict
+
+import numpy as np
 
 from constants import *
 
@@ -28,7 +31,8 @@ class CelestialObject(SpriteEntity):
         super().__init__()   
         self.__id = '0'
 
-        self.neighbours = pygame.sprite.Group()
+        # Id of the body in the scene's Simulation, set when added to a scene
+        self.body_id = None
 
         radius = kwargs.pop("radius", 0)
         self.density = kwargs.pop("density", PLANET_DEFAULT_DENSITY)
@@ -36,7 +40,6 @@ class CelestialObject(SpriteEntity):
         self.__radius = self.__correct_radius(radius)
         self.mass = self.density*(4/3*math.pi*(self.__radius**3)) 
         
-        self.F = vec3(0)
         self.acc = vec3(0)
         self.vel = vec3(0)
         self.pos = vec3(center[0], center[1], 0)
@@ -50,8 +53,6 @@ class CelestialObject(SpriteEntity):
         # Store the original image copy to prevent scale transform artifacts
         self.__zero_image = self.image.convert_alpha()
 
-        self.force_just_calcd = False  
-
     ###
     ### Properties
     ###
@@ -137,9 +138,8 @@ class CelestialObject(SpriteEntity):
         Update function
         """
         super().update(dt) # This is a waste right now but will leave
-        
-        # Euler function
-        self.__integration_euler()
+
+        # Position, velocity and acceleration are written by the scene from its Simulation
 
         # Update rect position from actual position
         self.rect.center = (int(self.pos.x), int(self.pos.y))
@@ -191,44 +191,6 @@ class CelestialObject(SpriteEntity):
 
         return radius
     
-    def __integration_euler(self):
-        '''
-        Calculates the new position and velocity using Euler integration method.
-        
-        The force is also added to the other object so it doesn't have to be 
-        calculated twice.
-        '''
-        for obj in self.neighbours:
-            if obj != self:
-                f = self.__get_force(obj)
-                self.F.x += f.x
-                self.F.y += f.y
-                if not self.force_just_calcd:                
-                    obj.F.x -= f.x
-                    obj.F.y -= f.y
-                    obj.force_just_calcd = True
-        self.force_just_calcd = True
-            
-        self.acc.x = self.F.x / self.mass
-        self.acc.y = self.F.y / self.mass
-        
-        self.pos.x += self.vel.x * DELTA_T + 0.5 * self.acc.x * DELTA_T
-        self.pos.y += self.vel.y * DELTA_T + 0.5 * self.acc.y * DELTA_T
-        
-        self.vel.x += self.acc.x * DELTA_T
-        self.vel.y += self.acc.y * DELTA_T
-        
-        self.F = vec3(0) #resets force for the next iteration
-        
-    def __get_force(self, obj) -> vec3:
-        '''
-        Return the force between self and obj.
-        '''
-        vect = vec3(obj.pos.x - self.pos.x, obj.pos.y - self.pos.y, 0)
-        dist = glm.distance(self.pos, obj.pos)
-        factor = self.mass * obj.mass / dist**3 #Power of 3 because the directional vector is not normalized
-        return vec3(vect.x*factor, vect.y*factor, 0)
-    
 class TransientDrawEntity():
     """
     Base class for Objects that will be drawn to screen but do not derive from pygame.sprite.Sprite
@@ -240,7 +202,11 @@ class TransientDrawEntity():
     def update(self, dt):
         pass
 
-    def draw(self, surface : pygame.Surface):
+    def draw(self, surface : pygame.Surface, offset=(0, 0)):
+        """
+        offset is an extra world space shift on top of world_offset, used to draw the copies
+        of a periodic world; screen space entities ignore it
+        """
         pass
 
 class VelocityArrow(TransientDrawEntity):
@@ -298,6 +264,11 @@ class VelocityArrow(TransientDrawEntity):
 
     def __recalculate_for_celestial(self):
         if self.parent:
+            # Parent was removed from its groups, this arrow goes with it
+            if not self.parent.alive():
+                self.dead = True
+                return
+
             if isinstance(self.parent, CelestialObject):
                 origin = self.parent.position
                 self.start = vec3(origin.x, origin.y, 0)
@@ -323,13 +294,14 @@ class VelocityArrow(TransientDrawEntity):
         self.start += self.world_offset
         self.end += self.world_offset
 
-    def draw(self, surface : pygame.Surface):
-        super().draw(surface)
+    def draw(self, surface : pygame.Surface, offset=(0, 0)):
+        super().draw(surface, offset)
+        ox, oy = offset
         # Draw the arrow line
-        pygame.draw.line(surface, self.color, (self.start.x, self.start.y), (self.end.x, self.end.y), self.thickness)    
+        pygame.draw.line(surface, self.color, (self.start.x + ox, self.start.y + oy), (self.end.x + ox, self.end.y + oy), self.thickness)
 
         # Draw the arrow head
-        arrow_points = self.__generate_arrowhead_method1(3)
+        arrow_points = [p + vec2(ox, oy) for p in self.__generate_arrowhead_method1(3)]
         pygame.draw.polygon(surface, self.color, arrow_points, 0)
 
     def __arrow_head(self):
@@ -365,17 +337,275 @@ class VelocityArrow(TransientDrawEntity):
 
         return arrow_points
 
+class TracerField(TransientDrawEntity):
+    """
+    Point renderer for tracer particles
+    - positions is an (M, 2) world space array, set by the scene each frame
+    - Transformed to screen space in one vectorized pass and written straight into the
+      surface pixels, one pixel per tracer
+    """
+    def __init__(self, color=TRACER_COLOR):
+        super().__init__()
+        self.color = color
+        self.positions = None
+
+    def draw(self, surface : pygame.Surface, offset=(0, 0)):
+        super().draw(surface, offset)
+        if self.positions is None or not len(self.positions):
+            return
+
+        # Same transform as the body sprites: zoom*(world + offset)
+        zoom = (self.world_offset.z+100)/100
+        sx = (zoom*(self.positions[:, 0] + self.world_offset.x + offset[0])).astype(np.intp)
+        sy = (zoom*(self.positions[:, 1] + self.world_offset.y + offset[1])).astype(np.intp)
+        w, h = surface.get_size()
+        on_screen = (sx >= 0) & (sx < w) & (sy >= 0) & (sy < h)
+
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[sx[on_screen], sy[on_screen]] = surface.map_rgb(self.color)
+        del pixels # unlock the surface
+
+class OrbitTrails(TransientDrawEntity):
+    """
+    Recent path of every body, drawn behind it
+    - One preallocated (max_bodies, length, 2) ring buffer holds all trails, so memory is
+      fixed however long the run; bodies past max_bodies simply get no trail
+    - sample() is fed the body arrays every frame and records one point per body each
+      `interval` simulation steps; all slots share one write head
+    - Slots of bodies that are gone are recycled on the next sample
+    - Drawn with one pygame.draw.lines call per fade band per trail, older bands blended
+      toward the background; past TRAIL_LINE_POINTS samples in total every sample is
+      written as a pixel through surfarray instead, in one vectorized pass
+    - In a periodic box trails are stored unwrapped and shifted so their newest point lies
+      in the box, they run on past the edge instead of jumping across the screen
+    """
+    def __init__(self, length=TRAIL_LENGTH, interval=TRAIL_INTERVAL, max_bodies=TRAIL_MAX_BODIES, fade=TRAIL_FADE, color=TRAIL_COLOR, box=0):
+        super().__init__()
+        self.length = length
+        self.interval = interval
+        self.fade = max(1, fade)
+        self.color = color
+        self.box = box
+        self.visible = True
+
+        self.__points = np.zeros((max_bodies, length, 2))
+        self.__filled = np.zeros(max_bodies, dtype=np.int64)   # samples held per slot
+        self.__stamp = np.zeros(max_bodies, dtype=np.int64)    # sample a slot was last written
+        self.__head = 0
+        self.__sample = 0
+        self.__last_tick = None
+        self.__slots = {}                                       # body id -> slot
+        self.__free = list(range(max_bodies - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.__slots)
+
+    def sample(self, step, ids : np.ndarray, pos : np.ndarray):
+        tick = step // self.interval
+        if tick == self.__last_tick:
+            return
+        self.__last_tick = tick
+        self.__sample += 1
+
+        slots = np.fromiter((self.__slot_of(i) for i in ids.tolist()), dtype=np.int64, count=len(ids))
+        have = slots >= 0
+        slots, pos = slots[have], np.asarray(pos, dtype=np.float64)[have]
+
+        if self.box:
+            prev = self.__points[slots, (self.__head - 1) % self.length]
+            d = pos - prev
+            d -= self.box*np.round(d/self.box)
+            pos = np.where((self.__filled[slots] > 0)[:, None], prev + d, pos)
+
+        self.__points[slots, self.__head] = pos
+        self.__filled[slots] = np.minimum(self.__filled[slots] + 1, self.length)
+        self.__stamp[slots] = self.__sample
+        self.__head = (self.__head + 1) % self.length
+
+        # Free the slots of bodies that were not in this sample
+        if len(slots) < len(self.__slots):
+            for body_id, slot in list(self.__slots.items()):
+                if self.__stamp[slot] != self.__sample:
+                    self.__release(body_id)
+
+    def clear(self):
+        for body_id in list(self.__slots):
+            self.__release(body_id)
+
+    def draw(self, surface : pygame.Surface, offset=(0, 0)):
+        super().draw(surface, offset)
+        if not self.visible or not self.__slots:
+            return
+        slots = np.fromiter(self.__slots.values(), dtype=np.int64)
+        slots = slots[self.__filled[slots] >= 2]
+        if not len(slots):
+            return
+
+        # Oldest first, then the same transform as the body sprites: zoom*(world + offset)
+        trails = self.__points[slots][:, (self.__head + np.arange(self.length)) % self.length]
+        if self.box:
+            trails -= self.box*np.floor(trails[:, -1:]/self.box)
+        zoom = (self.world_offset.z+100)/100
+        trails = zoom*(trails + (self.world_offset.x + offset[0], self.world_offset.y + offset[1]))
+
+        colors = [tuple(int(b + (c - b)*(k + 1)/self.fade) for c, b in zip(self.color, BACKGROUND_COLOR)) for k in range(self.fade)]
+        filled = self.__filled[slots]
+        if int(filled.sum()) > TRAIL_LINE_POINTS:
+            self.__draw_pixels(surface, trails, filled, colors)
+            return
+
+        for trail, n in zip(trails, filled.tolist()):
+            points = trail[self.length - n:].tolist()
+            step = (n - 1)/self.fade
+            for k, color in enumerate(colors):
+                lo, hi = int(k*step), int((k + 1)*step)
+                if hi > lo:
+                    pygame.draw.lines(surface, color, False, points[lo:hi + 1])
+
+    def __draw_pixels(self, surface, trails, filled, colors):
+        """
+        One pixel per sample for every trail at once, for when there are too many points
+        to draw as lines
+        """
+        age = np.arange(self.length)[None, :] - (self.length - filled)[:, None] # < 0 is unused
+        valid = age >= 0
+        band = np.minimum(age*self.fade//filled[:, None], self.fade - 1)[valid]
+        sx, sy = trails[valid].astype(np.intp).T
+        w, h = surface.get_size()
+        on_screen = (sx >= 0) & (sx < w) & (sy >= 0) & (sy < h)
+
+        palette = np.array([surface.map_rgb(c) for c in colors])
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[sx[on_screen], sy[on_screen]] = palette[band[on_screen]]
+        del pixels # unlock the surface
+
+    def __slot_of(self, body_id):
+        slot = self.__slots.get(body_id)
+        if slot is None:
+            if not self.__free:
+                return -1
+            slot = self.__free.pop()
+            self.__filled[slot] = 0
+            self.__slots[body_id] = slot
+        return slot
+
+    def __release(self, body_id):
+        slot = self.__slots.pop(body_id)
+        self.__filled[slot] = 0
+        self.__free.append(slot)
+
+class TrajectoryPreview(TransientDrawEntity):
+    """
+    Polyline along a predicted path
+    - source is called each draw for an (M, 2) world space array, e.g. a TrajectoryPredictor's path
+    """
+    def __init__(self, source, color=PREDICT_COLOR, thickness=1):
+        super().__init__()
+        self.source = source
+        self.color = color
+        self.thickness = thickness
+        self.visible = False
+
+    def draw(self, surface : pygame.Surface, offset=(0, 0)):
+        super().draw(surface, offset)
+        if not self.visible:
+            return
+        path = self.source()
+        if len(path) < 2:
+            return
+
+        # Same transform as the body sprites: zoom*(world + offset)
+        zoom = (self.world_offset.z+100)/100
+        points = zoom*(path + (self.world_offset.x + offset[0], self.world_offset.y + offset[1]))
+        pygame.draw.lines(surface, self.color, False, points.tolist(), self.thickness)
+
+class TextCache():
+    """
+    Rendered text surface cache
+    - Keyed on (font, text, color) so a string is only rasterized the first time it is seen
+    - Least recently used entries are evicted once max_entries is reached
+    """
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def render(self, font : pygame.font.Font, text, color) -> pygame.Surface:
+        key = (font, text, color)
+        surf = self.__entries.get(key)
+        if surf is not None:
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return surf
+
+        self.misses += 1
+        surf = font.render(text, False, pygame.Color(color[0], color[1], color[2]))
+        self.__entries[key] = surf
+        if len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self.__entries.clear()
+
+# Shared by all TextObjects unless one is given its own
+TEXT_CACHE = TextCache()
+
 class TextObject(TransientDrawEntity):
-    def __init__(self, text, font : pygame.font, color):
+    """
+    Text drawn to the screen
+    - The rendered surface is kept until text or color actually change, so
+      setting the same string every frame costs nothing
+    """
+    def __init__(self, text, font : pygame.font, color, position=(5, 5), cache : TextCache = None):
         super().__init__()
-        self.text = text
         self.font = font
-        self.color = color
+        self.position = position
+        self.cache = cache if cache is not None else TEXT_CACHE
+
+        self.__text = text
+        self.__color = tuple(color)
+        self.__surface = None
+
+    @property
+    def text(self):
+        return self.__text
+
+    @text.setter
+    def text(self, text):
+        if text != self.__text:
+            self.__text = text
+            self.__surface = None
+
+    @property
+    def color(self):
+        return self.__color
+
+    @color.setter
+    def color(self, color):
+        color = tuple(color)
+        if color != self.__color:
+            self.__color = color
+            self.__surface = None
 
-    def draw(self, surface : pygame.Surface):
-        super().draw(surface)
-        pycol = pygame.Color(self.color[0], self.color[1], self.color[2])
-        rtxt = self.font.render(self.text, False, pycol)
-        rsiz = self.font.size(self.text)
-        surface.blit(rtxt, (5, 5))
+    @property
+    def surface(self) -> pygame.Surface:
+        """
+        Rendered text, rasterized lazily on first use after a change
+        """
+        if self.__surface is None:
+            self.__surface = self.cache.render(self.font, self.__text, self.__color)
+        return self.__surface
+
+    @property
+    def size(self):
+        return self.surface.get_size()
 
+    def draw(self, surface : pygame.Surface, offset=(0, 0)):
+        super().draw(surface, offset)
+        surface.blit(self.surface, self.position)
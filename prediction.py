@@ -0,0 +1,134 @@
+import threading
+import time
+
+import numpy as np
+
+from constants import PREDICT_STEPS, PREDICT_BATCH
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+class TrajectoryPredictor(threading.Thread):
+    """
+    Background thread that integrates where a body about to be placed will go
+    - freeze(sim) takes the copy of the current bodies that every prediction starts from
+    - predict() (re)starts integrating the candidate body against that copy; a newer request
+      abandons the running one at its next batch
+    - The path grows by `batch` steps at a time so the preview fills in while it runs
+    - Uses the simulation's own integrator and force backend (through Simulation.clone)
+    """
+    def __init__(self, steps=PREDICT_STEPS, batch=PREDICT_BATCH):
+        super().__init__(name="trajectory-predictor", daemon=True)
+        self.steps = steps
+        self.batch = batch
+
+        self.__cond = threading.Condition()
+        self.__base = None
+        self.__job = None
+        self.__generation = 0
+        self.__stop = False
+
+        self.__path = np.zeros((steps + 1, 2))
+        self.__length = 0
+
+    @property
+    def path(self) -> np.ndarray:
+        """
+        Copy of the predicted world positions so far, oldest first
+        """
+        with self.__cond:
+            return self.__path[:self.__length].copy()
+
+    def freeze(self, sim : 'Simulation'):
+        """
+        Snapshot the bodies predictions run against, call on the thread stepping sim
+        """
+        base = sim.clone()
+        base.cull_every = 0
+        base.reorder_every = 0
+        base.on_retire = None
+        base.clear_tracers()
+        with self.__cond:
+            self.__base = base
+            self.__cond.notify()
+
+    def predict(self, position, velocity, mass, radius):
+        with self.__cond:
+            self.__generation += 1
+            self.__job = (self.__generation, position, velocity, mass, radius)
+            self.__length = 0
+            self.__cond.notify()
+
+    def cancel(self):
+        """
+        Drop the running prediction and the frozen bodies
+        """
+        with self.__cond:
+            self.__generation += 1
+            self.__job = None
+            self.__base = None
+            self.__length = 0
+
+    def stop(self, timeout=1.0):
+        with self.__cond:
+            self.__stop = True
+            self.__generation += 1
+            self.__cond.notify()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(lambda: self.__stop or (self.__job is not None and self.__base is not None))
+                if self.__stop:
+                    return
+                job, base = self.__job, self.__base
+                self.__job = None
+            self.__integrate(base, *job)
+
+    ###
+    ### Private functions
+    ###
+
+    def __integrate(self, base : 'Simulation', generation, position, velocity, mass, radius):
+        sim = base.clone()
+        body_id = sim.add_body(position, velocity, mass, radius)
+
+        row = sim.row_of(body_id)
+        last = sim.pos[row].astype(np.float64)
+        point = last.copy() # unwrapped, so a path across a periodic edge stays one line
+        if not self.__publish(generation, [point]):
+            return
+
+        done = 0
+        while done < self.steps:
+            n = min(self.batch, self.steps - done)
+            points = []
+            for _ in range(n):
+                sim.step()
+                row = sim.row_of(body_id)
+                p = sim.pos[row].astype(np.float64)
+                d = p - last
+                if sim.box:
+                    d -= sim.box*np.round(d/sim.box)
+                point = point + d
+                last = p
+                points.append(point)
+            done += n
+            if not self.__publish(generation, points):
+                return
+            time.sleep(0) # hand the GIL to the render loop between batches
+
+    def __publish(self, generation, points) -> bool:
+        """
+        Append points to the shared path, False once the prediction has been superseded
+        """
+        with self.__cond:
+            if generation != self.__generation:
+                return False
+            n = len(points)
+            self.__path[self.__length:self.__length + n] = points
+            self.__length += n
+            return True
@@ -0,0 +1,102 @@
+"""
+Replay a recorded input session headless and time it
+
+Usage:
+    python main.py --record session.jsonl.gz      (use the app, then close it)
+    python replay.py session.jsonl.gz --frame-ms 16
+    python replay.py session.jsonl.gz --no-draw --repeat 3
+
+Events are fed back through Inputs.handle_events / Inputs.update at a fixed frame time, with
+pygame's display in dummy (offscreen) mode, so a captured session becomes a repeatable
+benchmark of input dispatch, scene update and drawing.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy') # before pygame opens a window
+
+import numpy as np
+
+from inputs import Inputs, load_recording
+from constants import WARP_BATCH
+
+PHASES = ('dispatch', 'update', 'draw')
+
+def replay(path, frame_ms=16, draw=True, seed=0, state='draw', warp_steps=WARP_BATCH) -> dict:
+    """
+    Run the app through a recorded session and return per frame times (ms) of each phase
+    - dispatch: Inputs.handle_events and Inputs.update (Button/ActionContainer callbacks)
+    - update: App.update (state and scene, physics included)
+    - draw: App.draw_frame, or the status line while drawing is suspended
+    - A time warp runs warp_steps steps per frame rather than for a wall clock budget, so
+      every replay ends it on the same frame
+    """
+    from main import App # imported late so the dummy video driver is already selected
+
+    header, frames, count = load_recording(path)
+    Inputs.recorder = None
+    app = App(state)
+    app.data['fresh'] = True # never resume from the autosave, runs must be repeatable
+    app.data['autosave'] = False # and never write over it
+    Inputs.mouse_pos = tuple(header.get('mouse', (0, 0)))
+
+    # Builds the state, then fixes everything random or timed it owns
+    app.update(frame_ms)
+    scene = getattr(app.state, 'scene', None)
+    if scene is not None and hasattr(scene, 'rng'):
+        scene.rng = np.random.default_rng(seed)
+    if scene is not None and hasattr(scene, 'warp_frame_steps'):
+        scene.warp_frame_steps = warp_steps
+
+    times = {phase: np.zeros(count) for phase in PHASES}
+    for frame in range(count):
+        events = frames.get(frame, [])
+
+        t0 = time.perf_counter()
+        app.inputs.handle_events(events)
+        app.inputs.update(frame_ms)
+        t1 = time.perf_counter()
+        app.update(frame_ms)
+        t2 = time.perf_counter()
+        if draw:
+            if app.state.draw_suspended:
+                app.draw_status(frame_ms)
+            else:
+                app.hud.update(frame_ms)
+                app.draw_frame()
+        t3 = time.perf_counter()
+
+        times['dispatch'][frame] = (t1 - t0)*1000
+        times['update'][frame] = (t2 - t1)*1000
+        times['draw'][frame] = (t3 - t2)*1000
+
+    app.states.close()
+    return times
+
+def summary(times : dict) -> str:
+    lines = [f"{'phase':>9} {'mean ms':>8} {'p95 ms':>8} {'max ms':>8} {'total s':>8}"]
+    total = sum(times.values())
+    for name, t in list(times.items()) + [('frame', total)]:
+        if not len(t):
+            continue
+        lines.append(f"{name:>9} {t.mean():>8.3f} {np.percentile(t, 95):>8.3f} {t.max():>8.3f} {t.sum()/1000:>8.2f}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded input session headless")
+    parser.add_argument('recording')
+    parser.add_argument('--frame-ms', type=float, default=16, help="fixed frame time fed to the app")
+    parser.add_argument('--no-draw', action='store_true', help="skip drawing, time input and update only")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--warp-steps', type=int, default=WARP_BATCH, help="simulation steps per frame while a time warp runs")
+    args = parser.parse_args(argv)
+
+    for run in range(args.repeat):
+        times = replay(args.recording, args.frame_ms, not args.no_draw, args.seed, warp_steps=args.warp_steps)
+        print(f"run {run + 1}: {len(times['update'])} frames")
+        print(summary(times))
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,20 @@
+import math
+import time
+from collections import deque
+
+import numpy as np
+
 from glm import vec2, vec3
 import pygame
 
-from constants import BACKGROUND_COLOR, CAM_MOVE_SPEED, CAM_ZOOM_AMOUNT, ZOOM_MIN, ZOOM_MAX, TYPE_ACCEL, TYPE_VEL
-from objects import CelestialObject, SpriteEntity, TransientDrawEntity, TextObject, VelocityArrow
-from containers import CelestialSpriteGroup
+from constants import AUTOSAVE_SECONDS, CLEARED_SAVE_FILE, BACKGROUND_COLOR, CAM_MOVE_SPEED, CAM_ZOOM_AMOUNT, ZOOM_MIN, ZOOM_MAX, TYPE_ACCEL, TYPE_VEL, SIM_ASYNC, SIM_RATE_HZ, PERIODIC_BOX, WARP_STEPS, WARP_BATCH, WARP_FRAME_MS, TRACER_RING_COUNT, TRACER_RING_INNER, TRACER_RING_OUTER
+from objects import CelestialObject, TextObject, VelocityArrow, TracerField, TrajectoryPreview, OrbitTrails
+from containers import CelestialSpriteGroup, TransientGroup
+from simulation import Simulation, SimulationWorker
+from spatial import SpatialGrid
+from prediction import TrajectoryPredictor
+from checkpoint import read_snapshot, CheckpointWriter
+from fonts import cache_path
 
 class Camera():
     def __init__(self):
@@ -12,16 +23,119 @@ class Camera():
         self.tilt = 0
         self.yaw = 0
 
+        # Side of the periodic world being viewed, 0 when it is open
+        self.box = 0
+
+    @property
+    def zoom(self):
+        return (self.position.z+100)/100
+
     def shift(self, v : vec3):
         self.position += v
 
+    def tiles(self, view_size) -> list:
+        """
+        World shifts of every copy of the periodic box that overlaps the view, so the world
+        can be drawn wrapped around; just (0, 0) for an open world
+        """
+        if not self.box:
+            return [(0, 0)]
+        # Visible world rectangle, from screen = zoom*(world + camera offset)
+        x0, y0 = -self.position.x, -self.position.y
+        x1, y1 = view_size[0]/self.zoom + x0, view_size[1]/self.zoom + y0
+        xs = range(math.floor(x0/self.box), math.floor(x1/self.box) + 1)
+        ys = range(math.floor(y0/self.box), math.floor(y1/self.box) + 1)
+        return [(i*self.box, j*self.box) for i in xs for j in ys]
+
+class RenderLayer():
+    """
+    Named draw layer of a Scene
+    - Holds sprites (blitted together) and TransientDrawEntity objects (drawn by themselves)
+    - Everything in a layer is updated and drawn exactly once per tick, any other group an
+      entity belongs to is only for queries
+    - Layers that follow the camera hand its position to their entities as world_offset
+    - Drawing with tiles repeats the layer once per world shift, entities are still only
+      updated once
+    """
+    def __init__(self, name, follows_camera=True):
+        self.name = name
+        self.follows_camera = follows_camera
+        self.visible = True
+        self.zoom = 1
+
+        self.sprites = pygame.sprite.Group()
+        self.transients = TransientGroup()
+
+    def __len__(self):
+        return len(self.sprites) + len(self.transients)
+
+    def add(self, entity):
+        if isinstance(entity, pygame.sprite.Sprite):
+            self.sprites.add(entity)
+        else:
+            self.transients.add(entity)
+        return entity
+
+    def remove(self, entity):
+        if isinstance(entity, pygame.sprite.Sprite):
+            self.sprites.remove(entity)
+        else:
+            self.transients.remove(entity)
+
+    def update(self, delta_time, camera_pos : vec3):
+        if self.follows_camera:
+            self.zoom = (camera_pos.z+100)/100
+
+        for s in self.sprites:
+            if self.follows_camera:
+                s.world_offset = camera_pos
+            s.update(delta_time)
+
+        for t in self.transients:
+            if self.follows_camera:
+                t.world_offset = camera_pos
+            t.update(delta_time)
+        self.transients.reap()
+
+    def draw(self, surface : pygame.Surface, tiles=None):
+        if not self.visible:
+            return
+        if not tiles:
+            self.sprites.draw(surface)
+            for t in self.transients:
+                t.draw(surface)
+            return
+
+        for dx, dy in tiles:
+            sx, sy = self.zoom*dx, self.zoom*dy
+            surface.blits([(s.image, s.rect.move(sx, sy)) for s in self.sprites], doreturn=False)
+            for t in self.transients:
+                t.draw(surface, (dx, dy))
+
 class Scene():
+    # Render layers, drawn back to front
+    LAYERS = (
+        ('bodies', True),
+        ('overlays', True),
+        ('hud', False),
+    )
+
     def __init__(self, app):
         self.app = app
 
         self.background = BACKGROUND_COLOR
-        self.content = pygame.sprite.RenderUpdates()
         self.camera = Camera()
+        self.layers = {name: RenderLayer(name, follows) for name, follows in self.LAYERS}
+
+    def add(self, entity, layer):
+        """
+        Put an entity in the scene graph, it is updated and drawn once per tick by its layer
+        """
+        return self.layers[layer].add(entity)
+
+    def remove(self, entity):
+        for layer in self.layers.values():
+            layer.remove(entity)
 
     def move_cam_left(self):
         self.camera.shift(vec3(CAM_MOVE_SPEED, 0, 0))
@@ -48,60 +162,320 @@ class Scene():
             print("Can't zoom in further")
 
     def update(self, delta_time):
-        # Update all sprites in the scene.content
-        self.content.update(delta_time)
+        # Update every layer once
+        for layer in self.layers.values():
+            layer.update(delta_time, self.camera.position)
 
     def draw(self, surface : pygame.Surface):
-        # Draw all sprites in scene.content
-        dirty_rects = self.content.draw(surface)  # TODO: handle dirty rects back up to App.draw()
+        # Draw every layer once, back to front; a periodic world is tiled over the view
+        tiles = self.camera.tiles(surface.get_size()) if self.camera.box else None
+        for layer in self.layers.values():
+            layer.draw(surface, tiles if layer.follows_camera else None)
 
 class CelestialScene(Scene):
     """
     Celestial Scene Class
     - Handles graphical elements
     """
-    def __init__(self, app):
+    def __init__(self, app, run_async=SIM_ASYNC, rate_hz=SIM_RATE_HZ, box=PERIODIC_BOX, remote=None, autosave_path=None):
         super().__init__(app)
 
+        # Query group only, drawing and updating is done by the 'bodies' layer
         self.celest_objs = CelestialSpriteGroup()
-        self.transient_objs = []
-        
-        self.__camera_pos_disp = TextObject('X: 0, Y: 0 | Zoom: 0%', self.app.font, (0,0,0))
+
+        # Physics state, sprites only mirror it
+        self.simulation = Simulation(box=box)
+        self.camera.box = box
+        self.__bodies = {} # body id -> CelestialObject
+
+        # Index over body positions for picking and neighbour queries; when physics runs on this
+        # thread it is the simulation's own, shared with its overlap queries
+        self.spatial = SpatialGrid() if run_async or remote else self.simulation.spatial
+
+        # Ids of bodies the simulation retired (escaped), drained each update
+        self.__retired = deque()
+        self.simulation.on_retire = self.__retired.extend
+
+        # Viewer of a simulation server (network.SimulationClient): frames come from the
+        # stream, bodies are added and cleared by commands, nothing is stepped here
+        self.__remote = remote
+
+        # Optional background worker, the render loop then only reads published frames
+        self.__worker = None
+        if run_async and not remote:
+            self.__worker = SimulationWorker(self.simulation, rate_hz)
+            self.__worker.start()
+        self.__paused = False
+        self.__frame_version = None # (steps, revision) of the last applied frame
+
+        # Randomness for spawned content, reseed for repeatable runs (replay.py does)
+        self.rng = np.random.default_rng()
+
+        # Time warp bookkeeping: steps left (frame loop physics), start and size of the warp
+        self.__warp_left = 0
+        self.__warp = None          # (wall clock start, steps)
+        self.__warp_done = 0        # steps run by the frame loop warp
+        self.__frame_steps = 0      # simulation steps of the last applied frame
+        self.warp_frame_steps = 0   # fixed steps per frame instead of WARP_FRAME_MS, for repeatable runs
+        self.warp_report = ''
+
+        # All trails and all tracer particles are each drawn by one entity
+        self.trails = self.add(OrbitTrails(box=box), 'bodies')
+        self.tracers = self.add(TracerField(), 'bodies')
+
+        # Path preview for a body being placed, integrated off the frame path
+        self.__predictor = TrajectoryPredictor()
+        self.__predictor.start()
+        self.preview = self.add(TrajectoryPreview(lambda: self.__predictor.path), 'overlays')
+
+        # Saves are copied here and written on the checkpoint thread, autosaved every AUTOSAVE_SECONDS
+        self.__checkpoints = CheckpointWriter()
+        self.__checkpoints.start()
+        self.autosave_path = autosave_path
+        self.__autosave_elapsed = 0
+
+        self.__camera_pos_disp = self.add(TextObject('X: 0, Y: 0 | Zoom: 0%', self.app.font, (0,0,0)), 'hud')
+
+    @property
+    def transient_objs(self) -> TransientGroup:
+        """
+        Transients that follow a body (arrows)
+        """
+        return self.layers['overlays'].transients
+
+    @property
+    def paused(self):
+        return self.__paused
+
+    @paused.setter
+    def paused(self, p):
+        """
+        Pause physics only, the camera and sprites keep updating
+        """
+        self.__paused = p
+        if self.__worker:
+            self.__worker.paused = p
+
+    @property
+    def warping(self):
+        if self.__remote:
+            return False
+        if self.__worker:
+            return self.__worker.warp_remaining > 0
+        return self.__warp_left > 0
+
+    @property
+    def warp_status(self) -> str:
+        """
+        Progress line for a running warp, or the report of the last one
+        """
+        if not self.__warp:
+            return self.warp_report
+        started, total = self.__warp
+        done = self.__warp_steps_done()
+        elapsed = time.perf_counter() - started
+        rate = done/elapsed if elapsed > 0 else 0
+        return f"Time warp: {done}/{total} steps ({100*done/total:.0f}%), {rate:.0f} steps/s, t = {self.simulation.time:.1f}"
+
+    def start_warp(self, steps=WARP_STEPS):
+        """
+        Jump steps ahead with physics running back to back, nothing else is updated until done
+        """
+        if self.warping or steps <= 0 or self.__remote:
+            return
+        self.__warp = (time.perf_counter(), steps)
+        if self.__worker:
+            self.__worker.warp(steps)
+        else:
+            self.__warp_left = steps
+            self.__warp_done = 0
+
+    def stop_warp(self):
+        if self.__worker:
+            self.__worker.warp(0)
+        self.__warp_left = 0
+
+    def close(self):
+        """
+        Stop the physics worker or the server connection, and the trajectory predictor
+        - A last checkpoint is written on the way out when autosaving
+        """
+        if self.__worker:
+            self.__worker.stop()
+            self.__worker = None
+        if self.__remote:
+            self.__remote.close()
+        self.__predictor.stop()
+        if self.autosave_path:
+            self.checkpoint(self.autosave_path)
+        self.__checkpoints.stop()
+
+    def __submit(self, fn, *args, **kwargs):
+        """
+        Run a change to the simulation, on the worker thread when there is one
+        """
+        if self.__worker:
+            self.__worker.submit(fn, *args, **kwargs)
+        else:
+            fn(*args, **kwargs)
 
     def add_new_celestial(self, new_celestial):
         # New celestial instance with world_offset
         ctr = new_celestial.rect.center
         world_ctr = (ctr[0] + int(-self.camera.position.x), ctr[1] + int(-self.camera.position.y))
+        if self.simulation.box:
+            world_ctr = (world_ctr[0] % self.simulation.box, world_ctr[1] % self.simulation.box)
         new_celestial.position = world_ctr
-        
-        # Set the group to the celestial
-        new_celestial.neighbours = self.celest_objs
 
-        # Add to sprite.Group() for processing
-        self.celest_objs.add(new_celestial)
-        
-        # Add to scene sprite.Group() for drawing
-        self.content.add(new_celestial)
+        # The server creates the body, its sprite comes with the frame that first has it
+        if self.__remote:
+            vel = new_celestial.velocity
+            self.__remote.add_body(world_ctr, (vel.x, vel.y), new_celestial.mass, new_celestial.radius)
+            return new_celestial
+
+        # Register the body with the simulation
+        body_id = self.simulation.new_id()
+        new_celestial.body_id = body_id
+        vel = new_celestial.velocity
+        self.__submit(self.simulation.add_body, world_ctr, (vel.x, vel.y), new_celestial.mass, new_celestial.radius, body_id)
+
+        self.__track(new_celestial)
+        return new_celestial
+
+    def __track(self, celestial : CelestialObject):
+        """
+        Sprite side of a body: id lookup, query group, scene graph and its vector arrows
+        """
+        self.__bodies[celestial.body_id] = celestial
+
+        # Add to sprite.Group() for queries
+        self.celest_objs.add(celestial)
+
+        # Add to the scene graph for updating and drawing
+        self.add(celestial, 'bodies')
 
         # Add vector arrows to for celestial
-        arr_accel = VelocityArrow(new_celestial.position, new_celestial, color=(200,0,0), indicator_type=TYPE_ACCEL, thickness=1)
-        arr_vel = VelocityArrow(new_celestial.position, new_celestial, color=(0,70,170), indicator_type=TYPE_VEL, thickness=1)
+        arr_accel = VelocityArrow(celestial.position, celestial, color=(200,0,0), indicator_type=TYPE_ACCEL, thickness=1)
+        arr_vel = VelocityArrow(celestial.position, celestial, color=(0,70,170), indicator_type=TYPE_VEL, thickness=1)
 
-        self.transient_objs.append(arr_accel)
-        self.transient_objs.append(arr_vel)
+        self.add(arr_accel, 'overlays')
+        self.add(arr_vel, 'overlays')
 
-        return new_celestial
+    def begin_prediction(self):
+        """
+        Freeze the current bodies for previewing where a new one would go
+        - Not available to a viewer, the bodies live on the server
+        """
+        if self.__remote:
+            return
+        self.__submit(self.__predictor.freeze, self.simulation)
+        self.preview.visible = True
+
+    def predict_trajectory(self, screen_pos, velocity, mass, radius):
+        """
+        (Re)start the preview for a body released at screen_pos with velocity
+        - Placed the same way as add_new_celestial places it
+        """
+        world_pos = (screen_pos[0] + int(-self.camera.position.x), screen_pos[1] + int(-self.camera.position.y))
+        self.__predictor.predict(world_pos, (velocity.x, velocity.y), mass, radius)
+
+    def end_prediction(self):
+        self.__predictor.cancel()
+        self.preview.visible = False
+
+    def add_tracer_ring(self, body : CelestialObject, count=TRACER_RING_COUNT, inner=TRACER_RING_INNER, outer=TRACER_RING_OUTER):
+        """
+        Surround a body with a ring of massless tracers on circular orbits
+        - inner/outer are in radii of the body
+        """
+        if self.__remote:
+            return
+        rng = self.rng
+        r_in, r_out = inner*body.radius, outer*body.radius
+        r = np.sqrt(rng.uniform(r_in**2, r_out**2, count)) # uniform over the ring's area
+        theta = rng.uniform(0, 2*math.pi, count)
+        dirs = np.stack((np.cos(theta), np.sin(theta)), axis=1)
+
+        # Circular speed for the force law F = m1*m2/r^2, perpendicular to the radius
+        speed = np.sqrt(body.mass / r)
+        pos = (body.pos.x, body.pos.y) + dirs * r[:, None]
+        vel = (body.vel.x, body.vel.y) + np.stack((-dirs[:, 1], dirs[:, 0]), axis=1) * speed[:, None]
+
+        self.__submit(self.simulation.add_tracers, pos, vel)
+
+    def snapshot(self) -> dict:
+        """
+        Simulation state plus the camera, taken on the thread stepping the simulation
+        """
+        snap = self.simulation.snapshot()
+        snap['camera'] = np.array([self.camera.position.x, self.camera.position.y, self.camera.position.z])
+        return snap
+
+    def restore(self, snap : dict):
+        """
+        Replace every body, tracer and the camera with a snapshot
+        """
+        self.kill_all_objects()
+        if float(snap.get('box', 0)) != float(self.simulation.box):
+            print(f"Snapshot was taken in a box of {snap.get('box', 0)}, restoring into {self.simulation.box}")
+        self.__submit(self.simulation.restore, snap)
+
+        if 'camera' in snap:
+            self.camera.position = vec3(*np.asarray(snap['camera'], dtype=float).tolist())
+
+        # Sprites only mirror the simulation, positions are filled in by the next frame
+        for body_id, p, v, m, r in zip(snap['ids'].tolist(), snap['pos'].tolist(), snap['vel'].tolist(), snap['mass'].tolist(), snap['radius'].tolist()):
+            o = CelestialObject((int(p[0]), int(p[1])), radius=r)
+            o.mass = m
+            o.pos.x, o.pos.y = p
+            o.vel.x, o.vel.y = v
+            o.body_id = body_id
+            self.__track(o)
+
+    def save(self, path):
+        """
+        Write the scene to a snapshot file (for a warm start with main.py --scene)
+        """
+        if self.__remote:
+            print("Viewing a simulation server, nothing to save here")
+            return
+        self.checkpoint(path)
+        print(f"Saving scene to {path}")
+
+    def checkpoint(self, path):
+        """
+        Copy the state on the thread stepping the simulation and write it in the background
+        - Only the array copies run here (or on the worker), serializing and fsync do not
+        """
+        if self.__worker:
+            self.__worker.submit(lambda: self.__checkpoints.submit(path, self.snapshot()))
+        else:
+            self.__checkpoints.submit(path, self.snapshot())
+
+    def load(self, path):
+        self.restore(read_snapshot(path))
+        print(f"Loaded scene from {path}: {len(self.__bodies)} bodies")
 
     def kill_all_objects(self):
         """
         Private function to kill all objects
         """
+        # Keep what is about to go, main.py --scene can bring it back
+        if self.autosave_path and self.__bodies:
+            self.checkpoint(cache_path(CLEARED_SAVE_FILE))
+
         # Iterate and call pygame.sprite.Sprite kill() function to remove from any pygame.sprite.Groups()
+        # and drop the transients that follow them, the trajectory preview stays
         for o in self.celest_objs:
             o.kill()
-        
-        # Clear all transients
-        self.transient_objs.clear()
+            for layer in self.layers.values():
+                layer.transients.kill_children(o)
+        self.__bodies.clear()
+        if self.__remote:
+            self.__remote.clear()
+        else:
+            self.__submit(self.simulation.clear)
+        self.trails.clear()
 
         print(f"Killed all objects: Celestials: {len(self.celest_objs)}, Transients: {len(self.transient_objs)}")
 
@@ -109,48 +483,157 @@ class CelestialScene(Scene):
         """
         Update Scene
         """
-        super().update(delta_time)
+        # Advance physics (or pick up the worker's latest step) and mirror it onto the sprites
+        if self.__remote:
+            frame = self.__remote.read()
+            if frame:
+                self.__sync_bodies(frame)
+                self.__apply_frame(frame)
+        elif self.__worker:
+            if self.__worker.error:
+                raise RuntimeError(f"Simulation worker stopped: {self.__worker.error}") from self.__worker.error
+            frame = self.__worker.buffer.read()
+            if frame:
+                self.__apply_frame(frame)
+        else:
+            if self.__warp_left:
+                self.__warp_batches()
+            elif not self.__paused:
+                self.simulation.step()
+            self.__apply_frame(self.simulation)
+
+        # Remove sprites (and their arrows) for bodies the simulation retired
+        while self.__retired:
+            self.__retire(self.__retired.popleft())
+
+        if self.autosave_path and AUTOSAVE_SECONDS:
+            self.__autosave_elapsed += delta_time
+            if self.__autosave_elapsed >= AUTOSAVE_SECONDS*1000:
+                self.__autosave_elapsed = 0
+                self.checkpoint(self.autosave_path)
+
+        # Nothing is drawn while warping, leave the scene graph alone until it is over
+        if self.__warp:
+            if self.warping:
+                return
+            self.__finish_warp()
 
         # Update Camera Position Text Display
         cam_text = f"X: {self.camera.position.x}, Y: {self.camera.position.y} | Zoom: {self.camera.position.z+100}%"
         self.__camera_pos_disp.text = cam_text
 
-        # Call update() method of all sprites in the sprite.Group()
-        self.celest_objs.update(delta_time)
+        # Update every entity in the scene graph once
+        super().update(delta_time)
 
-        # Iterate sprite group
-        for o in self.celest_objs:
-            # Update world offset for all items
-            if isinstance(o, SpriteEntity):
-                o.world_offset = self.camera.position
-
-            # Reset 'just_calcd' variable for next frame
-            if isinstance(o, CelestialObject):
-                o.force_just_calcd = False
-
-        # Iterate transient non-sprite graphical objects list (in reverse to protect when removing)
-        for t in reversed(self.transient_objs):
-            # Update world offset, call update() and remove expired Transients
-            if isinstance(t, TransientDrawEntity):
-                t.world_offset = self.camera.position
-                t.update(delta_time)
-                if t.dead:
-                    self.transient_objs.remove(t)
+    ###
+    ### Queries
+    ###
 
-    def draw(self, surface : pygame.Surface):
+    def screen_to_world(self, screen_pos):
         """
-        Draw function
-        - Handles drawing any objects that are not automatically drawn through sprite.Group()s
+        Inverse of the sprite transform: screen = zoom*(world + camera offset)
+        - Folded back into the periodic box when there is one
         """
-        # Call super() draw() function to draw scene.content
-        super().draw(surface)
+        zoom = self.camera.zoom
+        x, y = screen_pos[0]/zoom - self.camera.position.x, screen_pos[1]/zoom - self.camera.position.y
+        if self.camera.box:
+            x, y = x % self.camera.box, y % self.camera.box
+        return (x, y)
 
-        # Draw sprites in sprite.Group()
-        self.celest_objs.draw(surface)
+    def body(self, body_id) -> CelestialObject:
+        return self.__bodies.get(int(body_id))
 
-        # Iterate all Transient objects and call .draw() func
-        for t in self.transient_objs:
-            if isinstance(t, TransientDrawEntity):
-                t.draw(surface)
+    def body_at(self, screen_pos) -> CelestialObject:
+        """
+        Body drawn under a screen position (e.g. the mouse), or None
+        """
+        body_id = self.spatial.pick(self.screen_to_world(screen_pos))
+        return None if body_id is None else self.body(body_id)
+
+    def bodies_within(self, world_pos, radius) -> list:
+        """
+        Bodies with their center within radius of a world position
+        """
+        return [o for o in map(self.body, self.spatial.query_radius(world_pos, radius).tolist()) if o]
+
+    def nearest_bodies(self, world_pos, k=1) -> list:
+        """
+        The k bodies closest to a world position, nearest first
+        """
+        return [o for o in map(self.body, self.spatial.nearest(world_pos, k).tolist()) if o]
+
+    def __warp_batches(self):
+        """
+        Step in batches of WARP_BATCH for up to WARP_FRAME_MS, then give the frame loop a turn
+        - With warp_frame_steps set, exactly that many steps per frame, whatever the machine speed
+        """
+        if self.warp_frame_steps:
+            n = min(self.warp_frame_steps, self.__warp_left)
+            self.simulation.step(n)
+            self.__warp_left -= n
+            self.__warp_done += n
+            return
+
+        deadline = time.perf_counter() + WARP_FRAME_MS/1000
+        while self.__warp_left and time.perf_counter() < deadline:
+            n = min(WARP_BATCH, self.__warp_left)
+            self.simulation.step(n)
+            self.__warp_left -= n
+            self.__warp_done += n
+
+    def __warp_steps_done(self):
+        """
+        Steps the warp itself ran, counted where they run (the worker, or the frame loop)
+        """
+        return self.__worker.warp_done if self.__worker else self.__warp_done
+
+    def __finish_warp(self):
+        started, _ = self.__warp
+        self.__warp = None
+        done = self.__warp_steps_done()
+        elapsed = time.perf_counter() - started
+        self.warp_report = f"Time warp: {done} steps in {elapsed:.2f} s ({done/elapsed if elapsed > 0 else 0:.0f} steps/s)"
+        print(self.warp_report)
+
+    def __retire(self, body_id):
+        o = self.__bodies.pop(int(body_id), None)
+        if o is not None:
+            o.kill()
+            for layer in self.layers.values():
+                layer.transients.kill_children(o)
 
-        self.__camera_pos_disp.draw(surface)
\ No newline at end of file
+    def __sync_bodies(self, frame):
+        """
+        Add sprites for bodies new in a streamed frame, retire those no longer in it
+        """
+        ids = frame.ids.tolist()
+        for body_id in self.__bodies.keys() - set(ids):
+            self.__retire(body_id)
+        for body_id, p, r in zip(ids, frame.pos.tolist(), frame.radius.tolist()):
+            if body_id not in self.__bodies:
+                o = CelestialObject((int(p[0]), int(p[1])), radius=r)
+                o.pos.x, o.pos.y = p
+                o.body_id = body_id
+                self.__track(o)
+
+    def __apply_frame(self, frame):
+        """
+        Copy simulated position, velocity and acceleration onto the matching sprites
+        - Skipped for a state already applied (paused physics), sprites and index are current
+        """
+        version = (frame.steps, frame.revision)
+        if version == self.__frame_version:
+            return
+        self.__frame_version = version
+        self.__frame_steps = frame.steps
+        self.spatial.update(frame.ids, frame.pos, frame.radius, (frame.steps, frame.revision))
+        self.trails.sample(frame.steps, frame.ids, frame.pos)
+        self.tracers.positions = frame.tracer_pos
+
+        for body_id, p, v, a in zip(frame.ids.tolist(), frame.pos.tolist(), frame.vel.tolist(), frame.acc.tolist()):
+            o = self.__bodies.get(body_id)
+            if o is None:
+                continue
+            o.pos.x, o.pos.y = p
+            o.vel.x, o.vel.y = v
+            o.acc.x, o.acc.y = a
@@ -0,0 +1,650 @@
+import copy
+import itertools
+import queue
+import threading
+import time
+
+import numpy as np
+
+from spatial import SpatialGrid, morton_codes
+from forces import make_backend
+from integrators import make_integrator
+from constants import WARP_BATCH, DELTA_T, PLANET_MIN_RADIUS, PLANET_MAX_DISTANCE, WORLD_CENTER, CULL_EVERY_STEPS, REORDER_EVERY_STEPS, SIM_DTYPE, PERIODIC_BOX, DIRECT_BLOCK_SIZE
+
+class Simulation():
+    """
+    Array backed n-body simulation
+    - Position, velocity, acceleration, mass and radius of every body live in flat arrays
+    - Bodies are addressed by a stable integer id; rows are an implementation detail
+    - Has no pygame dependency so it can be stepped headless or off the main thread
+    - Every cull_every steps, bodies further than max_distance from center are retired and
+      on_retire(ids) is called with their ids (on whichever thread is stepping)
+    - Tracers are massless particles in their own arrays: they feel the bodies' gravity but
+      exert none, so they cost O(bodies) each per step and have no ids
+    - Forces come from a backend (see forces.py) and stepping from an integrator (see
+      integrators.py), FORCE_BACKEND and INTEGRATOR unless given
+    - Every reorder_every steps rows are sorted along a Z-curve so bodies close in space are
+      close in memory; ids are unaffected
+    - dtype is the storage and compute precision of the body and tracer arrays; with float32
+      the force reductions and energy are still accumulated in float64
+    - With a periodic box (side > 0) the world is [0, box)^2: positions wrap around after
+      every step, forces and energy use minimum image separations and nothing is culled.
+      A force backend passed in must be built for the same box
+    """
+    def __init__(self, dt=DELTA_T, capacity=64, max_distance=PLANET_MAX_DISTANCE, cull_every=CULL_EVERY_STEPS, forces=None, integrator=None, reorder_every=REORDER_EVERY_STEPS, dtype=SIM_DTYPE, box=PERIODIC_BOX):
+        self.dt = dt
+        self.dtype = np.dtype(dtype)
+        self.box = box
+        self.time = 0.0
+        self.steps = 0
+        self.revision = 0 # bumped whenever bodies are added or removed outside a step
+        self.forces = forces if forces is not None else make_backend(box=box)
+        self.integrator = integrator if integrator is not None else make_integrator()
+
+        # Lifecycle
+        self.center = WORLD_CENTER
+        self.max_distance = max_distance
+        self.cull_every = cull_every
+        self.on_retire = None
+
+        self.reorder_every = reorder_every
+
+        self.__count = 0
+        self.__ids = np.zeros(capacity, dtype=np.int64)
+        self.__pos = np.zeros((capacity, 2), dtype=self.dtype)
+        self.__vel = np.zeros((capacity, 2), dtype=self.dtype)
+        self.__acc = np.zeros((capacity, 2), dtype=self.dtype)
+        self.__mass = np.zeros(capacity, dtype=self.dtype)
+        self.__radius = np.zeros(capacity, dtype=self.dtype)
+
+        # Tracer particles
+        self.__tcount = 0
+        self.__tpos = np.zeros((0, 2), dtype=self.dtype)
+        self.__tvel = np.zeros((0, 2), dtype=self.dtype)
+
+        # body id -> row
+        self.__rows = {}
+        self.__id_gen = itertools.count(1)
+
+        # Neighbour index over the bodies, rebuilt at most once per state (see index())
+        self.spatial = SpatialGrid()
+
+    ###
+    ### Properties (views over the live rows)
+    ###
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def ids(self):
+        return self.__ids[:self.__count]
+
+    @property
+    def pos(self):
+        return self.__pos[:self.__count]
+
+    @property
+    def vel(self):
+        return self.__vel[:self.__count]
+
+    @property
+    def acc(self):
+        return self.__acc[:self.__count]
+
+    @property
+    def mass(self):
+        return self.__mass[:self.__count]
+
+    @property
+    def radius(self):
+        return self.__radius[:self.__count]
+
+    @property
+    def tracer_count(self):
+        return self.__tcount
+
+    @property
+    def tracer_pos(self):
+        return self.__tpos[:self.__tcount]
+
+    @property
+    def tracer_vel(self):
+        return self.__tvel[:self.__tcount]
+
+    ###
+    ### Public functions
+    ###
+
+    def new_id(self):
+        """
+        Reserve a body id
+        - Safe to call from any thread, so the render loop can name a body before the worker adds it
+        """
+        return next(self.__id_gen)
+
+    def row_of(self, body_id):
+        return self.__rows.get(body_id)
+
+    def add_body(self, position, velocity=(0, 0), mass=1.0, radius=PLANET_MIN_RADIUS, body_id=None):
+        """
+        Add a body and return its id
+        """
+        if body_id is None:
+            body_id = self.new_id()
+        if self.__count == len(self.__ids):
+            self.__grow(2*len(self.__ids))
+
+        row = self.__count
+        self.__ids[row] = body_id
+        self.__pos[row] = self.wrap((position[0], position[1]))
+        self.__vel[row] = velocity[0], velocity[1]
+        self.__acc[row] = 0
+        self.__mass[row] = mass
+        self.__radius[row] = radius
+        self.__rows[body_id] = row
+        self.__count += 1
+        self.revision += 1
+        return body_id
+
+    def remove_body(self, body_id):
+        """
+        Remove a body by id
+        - The last row is moved into the hole so removal is O(1)
+        """
+        row = self.__rows.pop(body_id, None)
+        if row is None:
+            return False
+
+        last = self.__count - 1
+        if row != last:
+            for arr in (self.__ids, self.__pos, self.__vel, self.__acc, self.__mass, self.__radius):
+                arr[row] = arr[last]
+            self.__rows[int(self.__ids[row])] = row
+        self.__count = last
+        self.revision += 1
+        return True
+
+    def add_tracers(self, positions, velocities):
+        """
+        Add massless tracer particles from (M, 2) position and velocity arrays
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        velocities = np.asarray(velocities, dtype=np.float64).reshape(-1, 2)
+        n = self.__tcount + len(positions)
+        if n > len(self.__tpos):
+            cap = max(n, 2*len(self.__tpos))
+            tpos, tvel = np.zeros((cap, 2), dtype=self.dtype), np.zeros((cap, 2), dtype=self.dtype)
+            tpos[:self.__tcount] = self.tracer_pos
+            tvel[:self.__tcount] = self.tracer_vel
+            self.__tpos, self.__tvel = tpos, tvel
+        self.__tpos[self.__tcount:n] = self.wrap(positions)
+        self.__tvel[self.__tcount:n] = velocities
+        self.__tcount = n
+
+    def clear_tracers(self):
+        self.__tcount = 0
+
+    def clear(self):
+        self.__rows.clear()
+        self.__count = 0
+        self.__tcount = 0
+        self.revision += 1
+
+    def cull_escaped(self):
+        """
+        Retire every body further than max_distance from center and return their ids
+        - Escaped tracers are dropped as well
+        - Nothing escapes a periodic box
+        """
+        if not self.max_distance or self.box:
+            return np.zeros(0, dtype=np.int64)
+
+        # Tracers have no ids, compact the survivors in place
+        if self.__tcount:
+            tx = self.tracer_pos[:, 0] - self.center[0]
+            ty = self.tracer_pos[:, 1] - self.center[1]
+            keep = tx**2 + ty**2 <= self.max_distance**2
+            if not keep.all():
+                n = int(keep.sum())
+                self.__tpos[:n] = self.tracer_pos[keep]
+                self.__tvel[:n] = self.tracer_vel[keep]
+                self.__tcount = n
+
+        dx = self.pos[:, 0] - self.center[0]
+        dy = self.pos[:, 1] - self.center[1]
+        far = dx**2 + dy**2 > self.max_distance**2
+        ids = self.ids[far].copy()
+        for body_id in ids.tolist():
+            self.remove_body(body_id)
+
+        if len(ids) and self.on_retire:
+            self.on_retire(ids)
+        return ids
+
+    def snapshot(self) -> dict:
+        """
+        Copy of the full state as plain arrays and numbers, see restore()
+        - Only array copies, cheap enough to take between two frames
+        """
+        return {
+            'ids': self.ids.copy(),
+            'pos': self.pos.copy(),
+            'vel': self.vel.copy(),
+            'acc': self.acc.copy(),
+            'mass': self.mass.copy(),
+            'radius': self.radius.copy(),
+            'tracer_pos': self.tracer_pos.copy(),
+            'tracer_vel': self.tracer_vel.copy(),
+            'time': self.time,
+            'steps': self.steps,
+            'dt': self.dt,
+            'box': self.box,
+            'integrator': self.integrator.name,
+        }
+
+    def restore(self, snap : dict):
+        """
+        Replace the whole state with a snapshot() (bodies keep their ids)
+        """
+        ids = np.asarray(snap['ids'], dtype=np.int64)
+        n = len(ids)
+        if n > len(self.__ids):
+            self.__grow(n)
+        self.__count = n
+        self.__ids[:n] = ids
+        self.__pos[:n] = snap['pos']
+        self.__vel[:n] = snap['vel']
+        self.__acc[:n] = snap['acc']
+        self.__mass[:n] = snap['mass']
+        self.__radius[:n] = snap['radius']
+        self.__rows = {int(body_id): row for row, body_id in enumerate(ids.tolist())}
+        self.__id_gen = itertools.count(int(ids.max()) + 1 if n else 1)
+
+        self.__tcount = 0
+        self.add_tracers(snap['tracer_pos'], snap['tracer_vel'])
+
+        self.revision += 1
+        self.time = float(snap['time'])
+        self.steps = int(snap['steps'])
+        self.dt = float(snap['dt'])
+        if 'integrator' in snap and snap['integrator'] != self.integrator.name:
+            self.integrator = make_integrator(str(snap['integrator']))
+
+    def clone(self, dtype=None):
+        """
+        Independent copy of the simulation state, optionally converted to another dtype
+        - Shares the force backend, copies the integrator; on_retire is not carried over
+        """
+        sim = Simulation(self.dt, max(self.__count, 1), self.max_distance, self.cull_every, self.forces,
+                         copy.copy(self.integrator), self.reorder_every, dtype or self.dtype, self.box)
+        sim.center = self.center
+        sim.time = self.time
+        sim.steps = self.steps
+
+        sim.__count = self.__count
+        sim.__ids[:self.__count] = self.ids
+        sim.__pos[:self.__count] = self.pos
+        sim.__vel[:self.__count] = self.vel
+        sim.__acc[:self.__count] = self.acc
+        sim.__mass[:self.__count] = self.mass
+        sim.__radius[:self.__count] = self.radius
+        sim.__rows = dict(self.__rows)
+        sim.__id_gen = itertools.count(int(self.ids.max()) + 1 if self.__count else 1)
+        sim.add_tracers(self.tracer_pos, self.tracer_vel)
+        return sim
+
+    def reorder(self):
+        """
+        Sort bodies and tracers into Morton (Z-curve) order
+        - One argsort and a gather per array; the id -> row map is rebuilt so ids stay valid
+        """
+        n = self.__count
+        if n > 1:
+            order = np.argsort(morton_codes(self.pos), kind='stable')
+            for arr in (self.__ids, self.__pos, self.__vel, self.__acc, self.__mass, self.__radius):
+                arr[:n] = arr[:n][order]
+            self.__rows = dict(zip(self.ids.tolist(), range(n)))
+
+        if self.__tcount > 1:
+            order = np.argsort(morton_codes(self.tracer_pos), kind='stable')
+            self.__tpos[:self.__tcount] = self.tracer_pos[order]
+            self.__tvel[:self.__tcount] = self.tracer_vel[order]
+
+    def energy(self):
+        """
+        Total kinetic plus potential energy (G = 1, same units as the force law)
+        - Always computed in float64
+        """
+        pos, mass, vel = (a.astype(np.float64) for a in (self.pos, self.mass, self.vel))
+        kinetic = 0.5 * float(np.sum(mass * np.sum(vel**2, axis=1)))
+        potential = 0.0
+        for start in range(0, self.__count, DIRECT_BLOCK_SIZE):
+            stop = min(start + DIRECT_BLOCK_SIZE, self.__count)
+            d = pos[None, :, :] - pos[start:stop, None, :]
+            if self.box:
+                d -= self.box*np.round(d/self.box)
+            r = np.sqrt(d[..., 0]**2 + d[..., 1]**2)
+            # Only count each pair once (j > i)
+            upper = np.arange(self.__count)[None, :] > np.arange(start, stop)[:, None]
+            upper &= r > 0
+            potential -= float(np.sum((mass[start:stop, None] * mass[None, :])[upper] / r[upper]))
+        return kinetic + potential
+
+    def overlapping_pairs(self):
+        """
+        Ids of every pair of bodies whose circles currently overlap, as an (M, 2) array
+        - Pairs straddling a periodic box edge are not reported
+        """
+        return self.index().overlapping_pairs()
+
+    def index(self) -> SpatialGrid:
+        """
+        The spatial index, brought up to date only if a step or a body change happened since
+        """
+        self.spatial.update(self.ids, self.pos, self.radius, (self.steps, self.revision))
+        return self.spatial
+
+    def wrap(self, positions):
+        """
+        Positions folded back into the periodic box, unchanged in an open world
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        return np.mod(positions, self.box) if self.box else positions
+
+    def step(self, n=1):
+        """
+        Advance the simulation n steps of dt
+        """
+        for _ in range(n):
+            if self.__count or self.__tcount:
+                self.integrator.step(self, self.dt)
+                if self.box:
+                    np.mod(self.pos, self.box, out=self.pos)
+                    np.mod(self.tracer_pos, self.box, out=self.tracer_pos)
+            self.time += self.dt
+            self.steps += 1
+
+            if self.cull_every and self.steps % self.cull_every == 0:
+                self.cull_escaped()
+
+            if self.reorder_every and self.steps % self.reorder_every == 0:
+                self.reorder()
+
+    ###
+    ### Private functions
+    ###
+
+    def __grow(self, capacity):
+        def grown(arr):
+            new = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            new[:len(arr)] = arr
+            return new
+        self.__ids = grown(self.__ids)
+        self.__pos = grown(self.__pos)
+        self.__vel = grown(self.__vel)
+        self.__acc = grown(self.__acc)
+        self.__mass = grown(self.__mass)
+        self.__radius = grown(self.__radius)
+
+def precision_drift(sim : Simulation, steps, dtype=np.float32) -> dict:
+    """
+    Run a reduced precision copy of sim next to a float64 reference for `steps` steps
+    - Reports how far bodies drifted apart (max and median distance between the two runs)
+      and the relative energy error of each run
+    - Culling and reordering are off in both so rows stay comparable
+    """
+    runs = {}
+    for dt in (np.float64, dtype):
+        run = sim.clone(dt)
+        run.cull_every = 0
+        run.reorder_every = 0
+        e0 = run.energy()
+        started = time.perf_counter()
+        run.step(steps)
+        elapsed = time.perf_counter() - started
+        runs[np.dtype(dt).name] = (run, abs((run.energy() - e0)/e0) if e0 else 0.0, elapsed)
+
+    (ref, ref_err, ref_time), (low, low_err, low_time) = runs.values()
+    d = np.sqrt(np.sum((ref.pos - low.pos.astype(np.float64))**2, axis=1))
+    return {
+        'steps': steps,
+        'max_drift': float(d.max()) if len(d) else 0.0,
+        'median_drift': float(np.median(d)) if len(d) else 0.0,
+        'energy_error_float64': ref_err,
+        f'energy_error_{np.dtype(dtype).name}': low_err,
+        'seconds_float64': ref_time,
+        f'seconds_{np.dtype(dtype).name}': low_time,
+    }
+
+class SimulationFrame():
+    """
+    Copy of the simulation state after a completed step
+    - Arrays are reused between copies and only reallocated when the body count outgrows them
+    """
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.steps = 0
+        self.revision = 0
+        self.__ids = np.zeros(0, dtype=np.int64)
+        self.__pos = np.zeros((0, 2))
+        self.__vel = np.zeros((0, 2))
+        self.__acc = np.zeros((0, 2))
+        self.__radius = np.zeros(0)
+
+        self.tracer_count = 0
+        self.__tpos = np.zeros((0, 2))
+
+    @property
+    def ids(self):
+        return self.__ids[:self.count]
+
+    @property
+    def pos(self):
+        return self.__pos[:self.count]
+
+    @property
+    def vel(self):
+        return self.__vel[:self.count]
+
+    @property
+    def acc(self):
+        return self.__acc[:self.count]
+
+    @property
+    def radius(self):
+        return self.__radius[:self.count]
+
+    @property
+    def tracer_pos(self):
+        return self.__tpos[:self.tracer_count]
+
+    def copy_from(self, sim : Simulation):
+        n = sim.count
+        if n > len(self.__ids):
+            cap = max(n, 2*len(self.__ids))
+            self.__ids = np.zeros(cap, dtype=np.int64)
+            self.__pos = np.zeros((cap, 2))
+            self.__vel = np.zeros((cap, 2))
+            self.__acc = np.zeros((cap, 2))
+            self.__radius = np.zeros(cap)
+        self.count = n
+        self.time = sim.time
+        self.steps = sim.steps
+        self.revision = sim.revision
+        np.copyto(self.ids, sim.ids)
+        np.copyto(self.pos, sim.pos)
+        np.copyto(self.vel, sim.vel)
+        np.copyto(self.acc, sim.acc)
+        np.copyto(self.radius, sim.radius)
+
+        if sim.tracer_count > len(self.__tpos):
+            self.__tpos = np.zeros((max(sim.tracer_count, 2*len(self.__tpos)), 2))
+        self.tracer_count = sim.tracer_count
+        np.copyto(self.tracer_pos, sim.tracer_pos)
+
+class FrameBuffer():
+    """
+    Triple buffer between the simulation worker and the render loop
+    - The writer fills the back frame then swaps it with the middle one
+    - The reader swaps the middle frame to the front only when a newer one was published
+    - The lock only guards the index swap, never a copy, so neither side waits on the other's work
+    """
+    def __init__(self):
+        self.__frames = [SimulationFrame() for _ in range(3)]
+        self.__back, self.__middle, self.__front = 0, 1, 2
+        self.__fresh = False
+        self.__lock = threading.Lock()
+
+    def write(self, sim : Simulation):
+        self.__frames[self.__back].copy_from(sim)
+        with self.__lock:
+            self.__back, self.__middle = self.__middle, self.__back
+            self.__fresh = True
+
+    def read(self) -> SimulationFrame:
+        """
+        Latest published frame, or None if nothing new since the last read
+        """
+        with self.__lock:
+            if not self.__fresh:
+                return None
+            self.__front, self.__middle = self.__middle, self.__front
+            self.__fresh = False
+        return self.__frames[self.__front]
+
+class SimulationWorker(threading.Thread):
+    """
+    Background thread that steps a Simulation and publishes frames to a FrameBuffer
+    - rate_hz limits steps per second, 0 runs flat out
+    - Anything that changes the body set must go through submit() so it runs between steps
+    - NumPy releases the GIL inside the array kernels, so large steps overlap with the render loop
+    - warp(steps) runs that many steps in batches of warp_batch as fast as possible, ignoring
+      rate_hz and pause, publishing a frame after each batch
+    - An exception from a command or a step stops the thread and is kept in error
+    """
+    def __init__(self, simulation : Simulation, rate_hz=0, warp_batch=WARP_BATCH):
+        super().__init__(name="simulation-worker", daemon=True)
+        self.simulation = simulation
+        self.buffer = FrameBuffer()
+        self.rate_hz = rate_hz
+        self.warp_batch = warp_batch
+        self.error = None
+
+        self.__commands = queue.SimpleQueue()
+        self.__stop = threading.Event()
+        self.__running = threading.Event()
+        self.__running.set()
+
+        self.__warp_lock = threading.Lock()
+        self.__warp_left = 0
+        self.__warp_done = 0
+        self.__warp_id = 0 # which warp a batch belongs to, a new warp or cancel changes it
+
+    @property
+    def paused(self):
+        return not self.__running.is_set()
+
+    @paused.setter
+    def paused(self, p):
+        if p:
+            self.__running.clear()
+        else:
+            self.__running.set()
+
+    @property
+    def warp_remaining(self):
+        return self.__warp_left
+
+    @property
+    def warp_done(self):
+        """
+        Steps run by the current (or last) warp, counted on the worker from when it was accepted
+        """
+        return self.__warp_done
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a call to run on the worker thread before its next step
+        """
+        self.__commands.put((fn, args, kwargs))
+
+    def warp(self, steps):
+        """
+        Run steps ahead flat out, 0 cancels a running warp
+        """
+        with self.__warp_lock:
+            self.__warp_left = max(0, int(steps))
+            self.__warp_id += 1
+            if self.__warp_left:
+                self.__warp_done = 0
+
+    def stop(self, timeout=1.0):
+        self.__stop.set()
+        self.__running.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        try:
+            self.__run()
+        except Exception as e:
+            self.error = e
+            print(f"Simulation worker stopped: {e!r}")
+
+    def __run(self):
+        next_tick = time.perf_counter()
+        self.buffer.write(self.simulation)
+        while not self.__stop.is_set():
+            changed = self.__drain_commands()
+
+            if self.__warp_left:
+                self.__warp_step()
+                next_tick = time.perf_counter()
+                continue
+
+            if self.paused:
+                if changed:
+                    self.buffer.write(self.simulation)
+                self.__running.wait(0.01)
+                next_tick = time.perf_counter()
+                continue
+
+            self.simulation.step()
+            self.buffer.write(self.simulation)
+
+            # Pace to rate_hz, skipping ahead instead of bursting if we fell behind
+            if self.rate_hz:
+                next_tick += 1/self.rate_hz
+                wait = next_tick - time.perf_counter()
+                if wait > 0:
+                    self.__stop.wait(wait)
+                else:
+                    next_tick = time.perf_counter()
+
+    def __warp_step(self):
+        with self.__warp_lock:
+            n = min(self.warp_batch, self.__warp_left)
+            warp_id = self.__warp_id
+        self.simulation.step(n)
+        # Publish before counting down so the last batch is readable once the warp reads as over
+        self.buffer.write(self.simulation)
+        with self.__warp_lock:
+            # A cancel (or a new warp) may have come in while stepping
+            if warp_id == self.__warp_id:
+                self.__warp_left = max(0, self.__warp_left - n)
+                self.__warp_done += n
+            elif not self.__warp_left:
+                self.__warp_done += n # cancelled, the batch still ran
+
+    def __drain_commands(self):
+        changed = False
+        while True:
+            try:
+                fn, args, kwargs = self.__commands.get_nowait()
+            except queue.Empty:
+                return changed
+            fn(*args, **kwargs)
+            changed = True
@@ -0,0 +1,222 @@
+import numpy as np
+
+from constants import SPATIAL_CELL_SIZE
+
+# Added to cell coordinates so they pack into one non-negative int64 key
+_CELL_OFFSET = 1 << 30
+
+def _spread_bits(v):
+    """
+    Put a zero bit between each of the low 16 bits of v (uint64)
+    """
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+def morton_codes(pos : np.ndarray, bits=16) -> np.ndarray:
+    """
+    Z-curve index of every point, quantized to 2^bits cells per side of their bounding box
+    - Points close in space get close codes, so sorting by code gives memory locality
+    """
+    if not len(pos):
+        return np.zeros(0, dtype=np.uint64)
+    lo = pos.min(axis=0)
+    span = float((pos.max(axis=0) - lo).max()) or 1.0
+    q = ((pos - lo) * (((1 << bits) - 1)/span)).astype(np.uint64)
+    return _spread_bits(q[:, 0]) | (_spread_bits(q[:, 1]) << np.uint64(1))
+
+class SpatialGrid():
+    """
+    Uniform grid index over body positions
+    - Bodies are kept sorted by cell key, a cell is a contiguous run found with searchsorted
+    - update() re-sorts starting from the previous order; bodies rarely change cell between
+      frames so the (adaptive, stable) sort sees nearly sorted input and stays close to O(N)
+    - Cells are at least as wide as the largest body, so overlap tests only need adjacent cells
+    """
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.base_cell_size = cell_size
+        self.cell_size = cell_size
+
+        self.__ids = np.zeros(0, dtype=np.int64)
+        self.__pos = np.zeros((0, 2))
+        self.__radius = np.zeros(0)
+        self.__order = np.zeros(0, dtype=np.int64)
+        self.__keys = np.zeros(0, dtype=np.int64)   # cell keys in sorted order
+        self.version = None
+
+    def __len__(self):
+        return len(self.__ids)
+
+    ###
+    ### Maintenance
+    ###
+
+    def update(self, ids : np.ndarray, pos : np.ndarray, radius : np.ndarray, version=None) -> bool:
+        """
+        Re-index from the current body arrays
+        - version identifies the state the arrays hold (e.g. (steps, revision)); the same
+          version as the last update skips the work, False when nothing was re-indexed
+        """
+        if version is not None and version == self.version:
+            return False
+        self.version = version
+        n = len(ids)
+        self.__ids = np.array(ids, dtype=np.int64)
+        self.__pos = np.array(pos, dtype=np.float64)
+        self.__radius = np.array(radius, dtype=np.float64)
+        self.cell_size = max(self.base_cell_size, 2*float(self.__radius.max())) if n else self.base_cell_size
+
+        cx, cy = self.__cell_of(self.__pos)
+        keys = self.__key(cx, cy)
+
+        # Start from last frame's order when it still covers the same rows
+        order = self.__order if len(self.__order) == n else np.arange(n)
+        order = order[np.argsort(keys[order], kind='stable')]
+        self.__order = order
+        self.__keys = keys[order]
+        return True
+
+    ###
+    ### Queries
+    ###
+
+    def query_radius(self, center, r) -> np.ndarray:
+        """
+        Ids of bodies whose center is within r of center
+        """
+        rows = self.__rows_within(center, r)
+        return self.__ids[rows]
+
+    def pick(self, point):
+        """
+        Id of the body covering point (closest center wins), or None
+        """
+        rows = self.__candidate_rows(point, self.cell_size)
+        if not len(rows):
+            return None
+        d2 = self.__dist2(rows, point)
+        hit = d2 <= self.__radius[rows]**2
+        if not hit.any():
+            return None
+        rows, d2 = rows[hit], d2[hit]
+        return int(self.__ids[rows[np.argmin(d2)]])
+
+    def nearest(self, point, k=1) -> np.ndarray:
+        """
+        Ids of the k bodies with centers closest to point, nearest first
+        - Searches a growing square of cells until it holds k bodies, then checks the
+          circle that square guarantees
+        """
+        n = len(self.__ids)
+        k = min(k, n)
+        if not k:
+            return np.zeros(0, dtype=np.int64)
+
+        r = self.cell_size
+        while True:
+            rows = self.__rows_within(point, r)
+            if len(rows) >= k or len(rows) == n:
+                break
+            r *= 2
+
+        d2 = self.__dist2(rows, point)
+        nearest = np.argsort(d2, kind='stable')[:k]
+        return self.__ids[rows[nearest]]
+
+    def overlapping_pairs(self) -> np.ndarray:
+        """
+        Ids of every pair of bodies whose circles overlap, as an (M, 2) array
+        """
+        def overlap(ra, rb, d2):
+            return d2 < (self.__radius[ra] + self.__radius[rb])**2
+        return self.__neighbour_pairs(overlap)
+
+    def pairs_within(self, distance) -> np.ndarray:
+        """
+        Ids of every pair of bodies with centers closer than distance, as an (M, 2) array
+        - distance can be at most cell_size, build the grid with a big enough cell for it
+        """
+        if distance > self.cell_size:
+            raise ValueError(f"Pair distance {distance} is larger than the grid cell {self.cell_size}")
+        return self.__neighbour_pairs(lambda ra, rb, d2: d2 < distance*distance)
+
+    ###
+    ### Private functions
+    ###
+
+    def __neighbour_pairs(self, accept) -> np.ndarray:
+        """
+        Pair every body with the bodies in its own cell and four of its neighbours (so each
+        pair comes up once) and keep the pairs where accept(rows_a, rows_b, dist2) is true
+        """
+        n = len(self.__ids)
+        if n < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+
+        rows = self.__order
+        cx, cy = self.__cell_of(self.__pos[rows])
+        pairs = []
+        for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+            nkeys = self.__key(cx + dx, cy + dy)
+            lo = np.searchsorted(self.__keys, nkeys, 'left')
+            hi = np.searchsorted(self.__keys, nkeys, 'right')
+            counts = hi - lo
+            total = int(counts.sum())
+            if not total:
+                continue
+
+            # Expand every (body, neighbour run) into explicit index pairs
+            a = np.repeat(np.arange(n), counts)
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            b = starts + np.arange(total)
+            if (dx, dy) == (0, 0):
+                keep = b > a
+                a, b = a[keep], b[keep]
+            ra, rb = rows[a], rows[b]
+
+            d = self.__pos[ra] - self.__pos[rb]
+            hit = accept(ra, rb, d[:, 0]**2 + d[:, 1]**2)
+            pairs.append(np.stack((self.__ids[ra[hit]], self.__ids[rb[hit]]), axis=1))
+
+        if not pairs:
+            return np.zeros((0, 2), dtype=np.int64)
+        return np.concatenate(pairs)
+
+    def __cell_of(self, pos):
+        cell = np.floor(pos / self.cell_size).astype(np.int64)
+        return cell[..., 0], cell[..., 1]
+
+    def __key(self, cx, cy):
+        return ((cx + _CELL_OFFSET) << 32) | (cy + _CELL_OFFSET)
+
+    def __candidate_rows(self, center, r):
+        """
+        Rows of bodies in any cell touching the square of half width r around center
+        """
+        if not len(self.__ids):
+            return np.zeros(0, dtype=np.int64)
+        cs = self.cell_size
+        x0, x1 = int(np.floor((center[0] - r)/cs)), int(np.floor((center[0] + r)/cs))
+        y0, y1 = int(np.floor((center[1] - r)/cs)), int(np.floor((center[1] + r)/cs))
+
+        # Wider than there are bodies, cheaper to just take everything
+        if x1 - x0 + 1 > len(self.__ids):
+            return self.__order
+
+        # One contiguous key range per cell column
+        cols = np.arange(x0, x1 + 1, dtype=np.int64)
+        lo = np.searchsorted(self.__keys, self.__key(cols, np.int64(y0)), 'left')
+        hi = np.searchsorted(self.__keys, self.__key(cols, np.int64(y1)), 'right')
+        if not (hi - lo).any():
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.__order[l:h] for l, h in zip(lo.tolist(), hi.tolist()) if h > l])
+
+    def __rows_within(self, center, r):
+        rows = self.__candidate_rows(center, r)
+        return rows[self.__dist2(rows, center) <= r*r]
+
+    def __dist2(self, rows, point):
+        d = self.__pos[rows] - (point[0], point[1])
+        return d[:, 0]**2 + d[:, 1]**2
@@ -1,13 +1,16 @@
 import pygame
-from pygame.locals import MOUSEBUTTONDOWN, MOUSEBUTTONUP, KEYDOWN, MOUSEMOTION, K_SPACE, K_LEFT, K_RIGHT, K_UP, K_DOWN
+from pygame.locals import MOUSEBUTTONDOWN, MOUSEBUTTONUP, KEYDOWN, MOUSEMOTION, K_SPACE, K_LEFT, K_RIGHT, K_UP, K_DOWN, K_r, K_t, K_w, K_ESCAPE, K_F5, K_TAB, K_RETURN
 import glm
 from glm import vec2, vec3
 import math
+import os
+import threading
 
-from constants import BACKGROUND_COLOR
-from objects import CelestialObject, VelocityArrow
+from constants import BACKGROUND_COLOR, ARROW_TO_VEL_RATIO, SCENE_SAVE_FILE, AUTOSAVE_FILE, AUTOSAVE_RESUME
+from objects import CelestialObject, VelocityArrow, TextObject
 from inputs import Inputs, Button
-from scene import CelestialScene
+from hud import Hud, HudWidget
+from fonts import cache_path
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -18,14 +21,17 @@ class State:
     State base class
     - Derive from this class and override methods for each state
     """
-    def __init__(self, app, **kwargs):
+    def __init__(self, app, suspended=False, **kwargs):
         self.app: App = app
         self.name = ''
 
-        self.suspended = False
+        # Built ahead of time (StateManager.preload), the first switch to it resumes it
+        self.suspended = suspended
         self.terminated = False
 
         self.scene = None
+        # Bindings of this state, the App routes events here while it is active
+        self.inputs = Inputs()
 
         if kwargs:
             raise ValueError(f"Some kwargs not consumed: {kwargs}")
@@ -33,9 +39,43 @@ class State:
     def update(self, delta_time):
         self.scene.update(delta_time)
 
+    @property
+    def draw_suspended(self):
+        """
+        True while the state wants no frames drawn, only its status_text now and then
+        """
+        return False
+
+    @property
+    def status_text(self):
+        return ''
+
+    def suspend(self):
+        """
+        Called when the App switches away, the state is kept to be resumed later
+        """
+        self.suspended = True
+
+    def resume(self):
+        """
+        Called when the App switches back to a suspended state
+        """
+        self.suspended = False
+
+    def terminate(self):
+        """
+        Called when the state is dropped for good
+        """
+        self.terminated = True
+        if self.scene is not None and hasattr(self.scene, 'close'):
+            self.scene.close()
+
+    def draw(self):
+        pass
+
     @property
     def scene_bg(self):
-        return self.scene.background
+        return self.scene.background if self.scene is not None else BACKGROUND_COLOR
 
     # @property
     # def sprites(self):
@@ -48,17 +88,54 @@ class MenuState(State):
     def __init__(self, app, **kwargs):
         super().__init__(app, **kwargs)
 
+        self.title = TextObject("Enter: simulation   Tab: back to menu", app.font, (0,0,0))
+
+        self.inputs.register("start", Button(KEYDOWN, K_RETURN))
+        self.__start = self.inputs.inputs["start"].on_press(self.__open_simulation)
+
+        # Build the simulation while the menu is up so entering it is instant
+        app.states.preload('draw')
+
+    def __open_simulation(self):
+        self.app.state = 'draw'
+
     def update(self, delta_time):
         pass
 
+    def draw(self):
+        self.title.draw(self.app.screen)
+
 class DrawState(State):
     """
     Draw State Class
     """
     def __init__(self, app, **kwargs):
         super().__init__(app, **kwargs)
-        
-        self.scene = CelestialScene(app)
+
+        # Imported here so the physics stack only loads once a simulation is shown
+        from scene import CelestialScene
+
+        # Viewer of a simulation server (main.py --connect)
+        remote = None
+        if 'connect' in app.data:
+            from network import SimulationClient
+            remote = SimulationClient(*app.data['connect'])
+            remote.connect()
+        # Checkpoints are only written for a scene of the user's own (app.data['autosave'] = False
+        # for runs that are not: replays, startup timing)
+        checkpoint = None if remote else cache_path(AUTOSAVE_FILE)
+        autosave = checkpoint if app.data.get('autosave', True) else None
+        self.scene = CelestialScene(app, remote=remote, autosave_path=autosave)
+        # Hold physics before anything is loaded when built suspended
+        self.__paused_before = False
+        self.scene.paused = self.suspended
+
+        # Warm start from a saved scene (main.py --scene), or resume from the last checkpoint
+        scene_path = app.data.pop('scene_path', None)
+        if not scene_path and checkpoint and AUTOSAVE_RESUME and not app.data.pop('fresh', False) and os.path.exists(checkpoint):
+            scene_path = checkpoint
+        if scene_path:
+            self.scene.load(scene_path)
         
         self.__static_input_funcs = []
         self.__dynamic_input_funcs = {}
@@ -66,8 +143,22 @@ class DrawState(State):
 
         self.curr_celestial = None
         self.curr_velo_arrow = None
+        self.__predicted_for = None # mouse position the trajectory preview was last started for
+
+        # Inspection overlay for the body under the cursor
+        self.hud = self.scene.add(Hud(anchor='bottomleft'), 'hud')
+        self.hud.add(HudWidget(self.__hover_text, app.font, (0,0,0)))
+
+    @property
+    def paused(self):
+        return self.scene.paused
 
-        self.paused = False
+    @paused.setter
+    def paused(self, p):
+        """
+        Pauses physics only, camera and drawing keep running
+        """
+        self.scene.paused = p
 
     def __build_inputs(self):
         """
@@ -78,6 +169,12 @@ class DrawState(State):
         inputs.register("new_object", Button(MOUSEBUTTONDOWN, 1))
         inputs.register("update", Button(MOUSEMOTION, 0))
         inputs.register("kill_all_objects", Button(KEYDOWN, K_SPACE))
+        inputs.register("tracer_ring", Button(KEYDOWN, K_r))
+        inputs.register("trails", Button(KEYDOWN, K_t))
+        inputs.register("time_warp", Button(KEYDOWN, K_w))
+        inputs.register("cancel", Button(KEYDOWN, K_ESCAPE))
+        inputs.register("save", Button(KEYDOWN, K_F5))
+        inputs.register("menu", Button(KEYDOWN, K_TAB))
 
         inputs.register("mleft", Button(KEYDOWN, K_LEFT))
         inputs.register("mright", Button(KEYDOWN, K_RIGHT))
@@ -86,10 +183,10 @@ class DrawState(State):
         inputs.register("zoomin", Button(MOUSEBUTTONDOWN, 4))
         inputs.register("zoomout", Button(MOUSEBUTTONDOWN, 5))
 
-        self.app.inputs = inputs
+        self.inputs = inputs
 
         # Store functions to maintain weakrefs
-        self.__dynamic_input_funcs["temp"] = self.app.inputs.inputs["new_object"].on_press(self.__new_object_stage1)
+        self.__dynamic_input_funcs["temp"] = self.inputs.inputs["new_object"].on_press(self.__new_object_stage1)
 
         # Add all the inputs that do not change
         #
@@ -97,17 +194,76 @@ class DrawState(State):
         # TODO: Needs a restructure so not referring down to scene
         #
         #
-        self.__static_input_funcs.append(self.app.inputs.inputs["kill_all_objects"].on_press(self.scene.kill_all_objects))
-        # self.__static_input_funcs.append(self.app.inputs.inputs["kill_all_objects"].on_press(self.__reset_new_object_stage))
-        self.__static_input_funcs.append(self.app.inputs.inputs["mleft"].on_press_repeat(self.scene.move_cam_left, 0))
-        self.__static_input_funcs.append(self.app.inputs.inputs["mright"].on_press_repeat(self.scene.move_cam_right, 0))
-        self.__static_input_funcs.append(self.app.inputs.inputs["mup"].on_press_repeat(self.scene.move_cam_up, 0))
-        self.__static_input_funcs.append(self.app.inputs.inputs["mdown"].on_press_repeat(self.scene.move_cam_down, 0))
-        self.__static_input_funcs.append(self.app.inputs.inputs["zoomout"].on_press(self.scene.move_cam_out))
-        self.__static_input_funcs.append(self.app.inputs.inputs["zoomin"].on_press(self.scene.move_cam_in))
+        self.__static_input_funcs.append(self.inputs.inputs["kill_all_objects"].on_press(self.scene.kill_all_objects))
+        self.__static_input_funcs.append(self.inputs.inputs["tracer_ring"].on_press(self.__tracer_ring))
+        self.__static_input_funcs.append(self.inputs.inputs["trails"].on_press(self.__toggle_trails))
+        self.__static_input_funcs.append(self.inputs.inputs["time_warp"].on_press(self.__time_warp))
+        self.__static_input_funcs.append(self.inputs.inputs["cancel"].on_press(self.scene.stop_warp))
+        self.__static_input_funcs.append(self.inputs.inputs["save"].on_press(self.__save))
+        self.__static_input_funcs.append(self.inputs.inputs["menu"].on_press(self.__open_menu))
+        # self.__static_input_funcs.append(self.inputs.inputs["kill_all_objects"].on_press(self.__reset_new_object_stage))
+        self.__static_input_funcs.append(self.inputs.inputs["mleft"].on_press_repeat(self.scene.move_cam_left, 0))
+        self.__static_input_funcs.append(self.inputs.inputs["mright"].on_press_repeat(self.scene.move_cam_right, 0))
+        self.__static_input_funcs.append(self.inputs.inputs["mup"].on_press_repeat(self.scene.move_cam_up, 0))
+        self.__static_input_funcs.append(self.inputs.inputs["mdown"].on_press_repeat(self.scene.move_cam_down, 0))
+        self.__static_input_funcs.append(self.inputs.inputs["zoomout"].on_press(self.scene.move_cam_out))
+        self.__static_input_funcs.append(self.inputs.inputs["zoomin"].on_press(self.scene.move_cam_in))
+
+    def __hover_text(self):
+        o = self.scene.body_at(self.inputs.mouse_pos)
+        if o is None:
+            return ''
+        return f"{o.id}  mass: {o.mass:.0f}  radius: {o.radius}  vel: ({o.vel.x:.2f}, {o.vel.y:.2f})"
+
+    def __tracer_ring(self):
+        """
+        Private function to put a ring of tracers around the body under the cursor
+        """
+        o = self.scene.body_at(self.inputs.mouse_pos)
+        if o:
+            self.scene.add_tracer_ring(o)
+
+    @property
+    def draw_suspended(self):
+        return self.scene.warping
+
+    @property
+    def status_text(self):
+        return self.scene.warp_status
+
+    def __time_warp(self):
+        """
+        Private function to start a time warp, or stop the running one
+        """
+        if self.scene.warping:
+            self.scene.stop_warp()
+        elif not self.paused:
+            self.scene.start_warp()
+
+    def __open_menu(self):
+        self.app.state = 'menu'
+
+    def suspend(self):
+        """
+        Holds physics while another state is shown, the scene and its bodies are kept
+        """
+        super().suspend()
+        self.__paused_before = self.paused
+        self.scene.stop_warp()
+        self.paused = True
+
+    def resume(self):
+        super().resume()
+        self.paused = self.__paused_before
+
+    def __save(self):
+        self.scene.save(cache_path(SCENE_SAVE_FILE))
+
+    def __toggle_trails(self):
+        self.scene.trails.visible = not self.scene.trails.visible
 
     def __reset_new_object_stage(self):
-        self.__dynamic_input_funcs["temp"] = self.app.inputs.inputs["new_object"].on_press(self.__new_object_stage1)
+        self.__dynamic_input_funcs["temp"] = self.inputs.inputs["new_object"].on_press(self.__new_object_stage1)
         self.__dynamic_input_funcs["temp2"] = None
 
     def __new_object_stage1(self):
@@ -117,10 +273,10 @@ class DrawState(State):
         if not self.curr_celestial:
             self.paused = True
             # Replace functions for next stage
-            self.__dynamic_input_funcs["temp"] = self.app.inputs.inputs["new_object"].on_press_repeat(self.__new_object_stage1_cont, 0)
-            self.__dynamic_input_funcs["temp2"] = self.app.inputs.inputs["new_object"].on_release(self.__new_object_stage2)
+            self.__dynamic_input_funcs["temp"] = self.inputs.inputs["new_object"].on_press_repeat(self.__new_object_stage1_cont, 0)
+            self.__dynamic_input_funcs["temp2"] = self.inputs.inputs["new_object"].on_release(self.__new_object_stage2)
 
-            center = pygame.mouse.get_pos()
+            center = self.inputs.mouse_pos
             self.curr_celestial = CelestialObject(center) #set radius to 0 so the initializer will set PLANET_MIN_RADIUS
     
     def __new_object_stage1_cont(self):
@@ -130,7 +286,7 @@ class DrawState(State):
         if self.curr_celestial:
             center = self.curr_celestial.rect.center
             center_v = vec3(center[0], center[1], 0)
-            curpos = pygame.mouse.get_pos()
+            curpos = self.inputs.mouse_pos
             curpos_v = vec3(curpos[0], curpos[1], 0)
             self.curr_celestial.radius = math.floor(glm.distance(center_v, curpos_v))   
 
@@ -140,12 +296,12 @@ class DrawState(State):
         """
         if self.curr_celestial:
             # Replace functions for next stage
-            self.__dynamic_input_funcs["temp"] = self.app.inputs.inputs["update"].always(self.__new_object_stage2_cont)
-            self.__dynamic_input_funcs["temp2"] = self.app.inputs.inputs["new_object"].on_press(self.__new_object_stage3)
+            self.__dynamic_input_funcs["temp"] = self.inputs.inputs["update"].always(self.__new_object_stage2_cont)
+            self.__dynamic_input_funcs["temp2"] = self.inputs.inputs["new_object"].on_press(self.__new_object_stage3)
             
             center = self.curr_celestial.rect.center
             center_v = vec3(center[0], center[1], 0)
-            curpos = pygame.mouse.get_pos()
+            curpos = self.inputs.mouse_pos
             curpos_v = vec3(curpos[0], curpos[1], 0)
             self.curr_celestial.radius = math.floor(glm.distance(center_v, curpos_v))
             self.setting_velocity = True
@@ -154,12 +310,30 @@ class DrawState(State):
             self.curr_velo_arrow = VelocityArrow(center)
             # self.scene.transient_objs.append(self.curr_velo_arrow)
 
+            # Preview where the body would go, against the bodies as they are now
+            self.scene.begin_prediction()
+            self.__predict()
+
     def __new_object_stage2_cont(self):
         """
         Private function to update velocity arrow
         """           
         if self.curr_celestial and self.curr_velo_arrow:
-            self.curr_velo_arrow.arrow_end = pygame.mouse.get_pos()
+            # Compare with the pointer rather than the arrow end, which stops at ARROW_MAX_LENGTH
+            end = self.inputs.mouse_pos
+            if end != self.__predicted_for:
+                self.curr_velo_arrow.arrow_end = end
+                self.__predict()
+
+    def __predict(self):
+        """
+        Private function to restart the trajectory preview for the arrow as it is now
+        """
+        vc = self.curr_velo_arrow.velocity_component
+        vel = vec3(vc.x, -vc.y, 0) * ARROW_TO_VEL_RATIO # same conversion as the velocity setter
+        c = self.curr_celestial
+        self.scene.predict_trajectory(c.rect.center, vel, c.mass, c.radius)
+        self.__predicted_for = self.inputs.mouse_pos
 
     def __new_object_stage3(self):
         """
@@ -167,7 +341,7 @@ class DrawState(State):
         """          
         if self.curr_celestial and self.curr_velo_arrow:
             # Replace functions to start over
-            self.__dynamic_input_funcs["temp"] = self.app.inputs.inputs["new_object"].on_press(self.__new_object_stage1)            
+            self.__dynamic_input_funcs["temp"] = self.inputs.inputs["new_object"].on_press(self.__new_object_stage1)            
             self.__dynamic_input_funcs["temp2"] = None
 
             vc = self.curr_velo_arrow.velocity_component
@@ -175,12 +349,14 @@ class DrawState(State):
             self.curr_celestial.velocity = vel
 
             # Add celestial to the scene with add_new_celestial function to have world_offset applied
+            self.scene.end_prediction()
             self.scene.add_new_celestial(self.curr_celestial)
 
             #Clean up
             self.curr_celestial = None # completed drawing the celestial
             self.curr_velo_arrow.dead = True
             self.curr_velo_arrow = None
+            self.__predicted_for = None
             self.paused = False
 
     def update(self, delta_time):
@@ -189,8 +365,8 @@ class DrawState(State):
             if self.curr_celestial:
                 self.curr_celestial.update(delta_time)
 
-            # Update the scene
-            self.scene.update(delta_time)
+        # Update the scene (physics is held by the scene itself while paused)
+        self.scene.update(delta_time)
 
     def draw(self):
         # Blit currently drawing celestial
@@ -201,4 +377,110 @@ class DrawState(State):
             self.curr_velo_arrow.draw(self.app.screen)
 
         # Draw teh scene
-        self.scene.draw(self.app.screen)
\ No newline at end of file
+        self.scene.draw(self.app.screen)
+
+###
+### State management
+###
+
+class StateManager():
+    """
+    Builds, keeps and switches the App states
+    - Each state is built once; switching away suspends it (scene, bodies and input bindings
+      stay alive) and switching back resumes it
+    - preload(name) builds a state on a background thread ahead of the switch, switch()
+      waits for a preload still running rather than building a second copy
+    - A preloaded state is built suspended, its simulation does not run until switch()
+      resumes it
+    - States must not touch the App's active state or inputs while being built
+    """
+    def __init__(self, app, states : dict):
+        self.app = app
+        self.classes = states
+        self.active : State = None
+
+        self.__states = {}
+        self.__loading = {}
+        self.__errors = {}
+        self.__lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name.lower() in self.__states
+
+    def preload(self, name):
+        """
+        Start building a state in the background, no-op when it is built or being built
+        """
+        name = name.lower()
+        with self.__lock:
+            if name in self.__states or name in self.__loading:
+                return
+            thread = threading.Thread(target=self.__build, args=(name, True), name=f"preload-{name}", daemon=True)
+            self.__loading[name] = thread
+        thread.start()
+
+    def get(self, name) -> State:
+        """
+        The state called name, built now if it was neither built nor preloaded
+        """
+        name = name.lower()
+        with self.__lock:
+            thread = self.__loading.get(name)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self.__lock:
+            error = self.__errors.pop(name, None)
+        if error is not None:
+            raise error
+        if name not in self.__states:
+            self.__build(name)
+        return self.__states[name]
+
+    def switch(self, name) -> State:
+        """
+        Suspend the active state and make name the active one
+        """
+        state = self.get(name)
+        if state is self.active:
+            return state
+        if self.active is not None:
+            self.active.suspend()
+        if state.suspended:
+            state.resume()
+        self.active = state
+        return state
+
+    def drop(self, name):
+        """
+        Terminate a state and forget it, the next switch to name builds it afresh
+        """
+        name = name.lower()
+        state = self.__states.pop(name, None)
+        if state is None:
+            return
+        state.terminate()
+        if state is self.active:
+            self.active = None
+
+    def close(self):
+        for name in list(self.__states):
+            self.drop(name)
+
+    ###
+    ### Private functions
+    ###
+
+    def __build(self, name, suspended=False):
+        try:
+            state = self.classes[name](self.app, suspended=suspended)
+            state.name = name
+            with self.__lock:
+                self.__states[name] = state
+        except Exception as e:
+            if threading.current_thread() is threading.main_thread():
+                raise
+            with self.__lock:
+                self.__errors[name] = e # re-raised by get() on the main thread
+        finally:
+            with self.__lock:
+                self.__loading.pop(name, None)
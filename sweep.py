@@ -0,0 +1,227 @@
+"""
+Parameter sweep runner
+- Expands a grid of scenario parameters and runs every variant headless in a process pool
+- Each finished run is appended to a JSON lines checkpoint, so an interrupted sweep resumes
+  where it stopped
+- Runs are seeded, and identical parameters give bit-for-bit identical results (see `checksum`)
+
+Usage:
+    python sweep.py --grid density=0.005,0.01 dt=0.1,0.05 --seeds 3 --out sweep.jsonl
+"""
+import argparse
+import ast
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from constants import DELTA_T, PLANET_DEFAULT_DENSITY, PLANET_MAX_DISTANCE, PLANET_MIN_RADIUS, WORLD_CENTER
+from simulation import Simulation
+
+# Every parameter a variant can set, with the value used when the grid leaves it out
+SCENARIO_DEFAULTS = {
+    'bodies': 8,
+    'density': PLANET_DEFAULT_DENSITY,
+    'dt': DELTA_T,
+    'steps': 2000,
+    'seed': 0,
+    'spread': 600,          # bodies start within this distance of the screen center
+    'speed': 2.0,           # largest initial speed component
+    'min_radius': PLANET_MIN_RADIUS,
+    'max_radius': 40,
+    'sample_every': 10,     # steps between ejection/collision checks
+}
+
+def expand_grid(grid : dict, seeds=1) -> list:
+    """
+    Cartesian product of the grid values, one parameter dict per variant and seed
+    """
+    unknown = set(grid) - set(SCENARIO_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+
+    names = sorted(grid)
+    variants = []
+    for values in itertools.product(*(grid[n] for n in names)):
+        params = dict(SCENARIO_DEFAULTS)
+        params.update(zip(names, values))
+        if 'seed' in grid:
+            variants.append(params)
+        else:
+            for seed in range(seeds):
+                variants.append(dict(params, seed=seed))
+    return variants
+
+def run_key(params : dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+def build_scenario(params : dict) -> Simulation:
+    """
+    Seeded random scene around the screen center
+    """
+    rng = np.random.default_rng(params['seed'])
+    n = params['bodies']
+    # No culling, energy error is only meaningful while every body is still in the sum
+    sim = Simulation(dt=params['dt'], capacity=max(n, 1), cull_every=0)
+
+    radius = rng.integers(params['min_radius'], params['max_radius'], size=n, endpoint=True)
+    angle = rng.uniform(0, 2*np.pi, size=n)
+    dist = params['spread'] * np.sqrt(rng.uniform(0, 1, size=n))
+    pos = np.stack((WORLD_CENTER[0] + dist*np.cos(angle), WORLD_CENTER[1] + dist*np.sin(angle)), axis=1)
+    vel = rng.uniform(-params['speed'], params['speed'], size=(n, 2))
+
+    for i in range(n):
+        r = int(radius[i])
+        # Mass as set by CelestialObject.radius when a body is drawn
+        sim.add_body(pos[i], vel[i], params['density']*r**3, r)
+    return sim
+
+def run_variant(params : dict) -> dict:
+    """
+    Run one variant to completion and summarize it
+    """
+    started = time.perf_counter()
+    sim = build_scenario(params)
+    e0 = sim.energy()
+
+    ejected = set()
+    collided = set()
+    max_energy_err = 0.0
+    center = np.array(WORLD_CENTER)
+
+    remaining = params['steps']
+    while remaining > 0:
+        n = min(params['sample_every'], remaining)
+        sim.step(n)
+        remaining -= n
+
+        far = np.sum((sim.pos - center)**2, axis=1) > PLANET_MAX_DISTANCE**2
+        ejected.update(sim.ids[far].tolist())
+        collided.update(map(tuple, sim.overlapping_pairs().tolist()))
+        if e0:
+            max_energy_err = max(max_energy_err, abs((sim.energy() - e0)/e0))
+
+    e1 = sim.energy()
+    digest = hashlib.sha256()
+    digest.update(sim.pos.tobytes())
+    digest.update(sim.vel.tobytes())
+
+    return {
+        'key': run_key(params),
+        'params': params,
+        'ejections': len(ejected),
+        'collisions': len(collided),
+        'energy_error': abs((e1 - e0)/e0) if e0 else 0.0,
+        'max_energy_error': max_energy_err,
+        'sim_time': sim.time,
+        'checksum': digest.hexdigest(),
+        'wall_time': time.perf_counter() - started,
+    }
+
+def load_checkpoint(path) -> dict:
+    """
+    Completed runs from a checkpoint file, keyed by run key
+    - A truncated last line (interrupted write) is ignored and that run is redone
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[result['key']] = result
+    return done
+
+def run_sweep(variants : list, out_path, workers=None, tasks_per_child=16, progress=print) -> list:
+    """
+    Run every variant not already in the checkpoint and return all results in variant order
+    - At most 2 tasks per worker are in flight, so queued work never piles up in memory
+    - Worker processes are recycled every tasks_per_child runs to keep their memory bounded
+    """
+    done = load_checkpoint(out_path)
+    todo = [v for v in variants if run_key(v) not in done]
+    progress(f"{len(variants)} variants, {len(variants)-len(todo)} already done, {len(todo)} to run")
+
+    workers = workers or os.cpu_count() or 1
+    ctx = multiprocessing.get_context('spawn')
+    pending = iter(todo)
+    with open(out_path, 'a') as out, ProcessPoolExecutor(workers, mp_context=ctx, max_tasks_per_child=tasks_per_child) as pool:
+        in_flight = set()
+        while True:
+            for params in itertools.islice(pending, 2*workers - len(in_flight)):
+                in_flight.add(pool.submit(run_variant, params))
+            if not in_flight:
+                break
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                result = fut.result()
+                done[result['key']] = result
+
+                # Checkpoint each result as soon as it is in
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+                progress(f"[{len(done)}/{len(variants)}] {result['key']}")
+
+    return [done[run_key(v)] for v in variants]
+
+def summary_table(results : list, columns=None) -> str:
+    """
+    One row per run: the parameters that vary across the sweep, then the outcomes
+    """
+    if not results:
+        return ''
+    if columns is None:
+        columns = [k for k in SCENARIO_DEFAULTS if len({r['params'][k] for r in results}) > 1]
+
+    header = columns + ['ejections', 'collisions', 'energy_err', 'max_energy_err', 'checksum']
+    rows = []
+    for r in results:
+        rows.append([str(r['params'][c]) for c in columns] + [
+            str(r['ejections']),
+            str(r['collisions']),
+            f"{r['energy_error']:.3e}",
+            f"{r['max_energy_error']:.3e}",
+            r['checksum'][:12],
+        ])
+
+    widths = [max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(header)]
+    lines = ['  '.join(h.rjust(w) for h, w in zip(header, widths))]
+    lines.append('  '.join('-'*w for w in widths))
+    lines.extend('  '.join(c.rjust(w) for c, w in zip(row, widths)) for row in rows)
+    return '\n'.join(lines)
+
+def parse_grid(specs : list) -> dict:
+    """
+    ['density=0.005,0.01', 'bodies=8'] -> {'density': [0.005, 0.01], 'bodies': [8]}
+    """
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        grid[name.strip()] = [ast.literal_eval(v) for v in values.split(',')]
+    return grid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a headless parameter sweep")
+    parser.add_argument('--grid', nargs='*', default=[], help="name=v1,v2,... for any of: " + ', '.join(SCENARIO_DEFAULTS))
+    parser.add_argument('--seeds', type=int, default=1, help="seeds per variant when seed is not in the grid")
+    parser.add_argument('--out', default='sweep.jsonl', help="checkpoint / results file")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--tasks-per-child', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    variants = expand_grid(parse_grid(args.grid), args.seeds)
+    results = run_sweep(variants, args.out, args.workers, args.tasks_per_child)
+    print(summary_table(results))
+
+if __name__ == '__main__':
+    main()